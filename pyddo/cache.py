@@ -0,0 +1,118 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from os.path import getmtime, join
+from os import unlink
+from threading import Lock, Thread
+from hashlib import sha1
+import time
+
+from pyddo.files import atomic_write, cache_directory
+
+class DataCenterCache:
+    # Stores the raw GetDatacenters reply, the file's mtime is the time it
+    # was fetched. Stale copies are served while a refresh runs.
+    def __init__(self, directory = None, ttl = 24 * 60 * 60, background = True):
+        self._directory = directory or cache_directory()
+        self._ttl = ttl
+        self._background = background
+        self._lock = Lock()
+        self._refreshing = {}
+        self._lasterror = None
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    @property
+    def last_error(self):
+        return self._lasterror
+
+    def _path(self, game, url):
+        key = sha1('{0}\n{1}'.format(game, url).encode('utf-8')).hexdigest()
+        return join(self._directory, 'datacenters-{0}.xml'.format(key[:16]))
+
+    def load(self, game, url):
+        path = self._path(game, url)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            return data, time.time() - getmtime(path)
+        except OSError:
+            return None
+
+    def store(self, game, url, data):
+        atomic_write(self._path(game, url), data)
+
+    def invalidate(self, game, url):
+        try:
+            unlink(self._path(game, url))
+        except FileNotFoundError:
+            pass
+
+    def _update(self, game, url, fetch):
+        data = fetch()
+        self.store(game, url, data)
+        self._lasterror = None
+        return data
+
+    def _revalidate(self, game, url, fetch):
+        try:
+            self._update(game, url, fetch)
+        except Exception as e:
+            # Keep serving the last good copy.
+            self._lasterror = e
+        finally:
+            with self._lock:
+                del self._refreshing[(game, url)]
+
+    def refresh(self, game, url, fetch):
+        key = (game, url)
+        with self._lock:
+            t = self._refreshing.get(key)
+            if t is None:
+                t = Thread(target = self._revalidate, args = (game, url, fetch), daemon = True)
+                self._refreshing[key] = t
+                t.start()
+        return t
+
+    def get(self, game, url, fetch):
+        cached = self.load(game, url)
+        if cached is None:
+            return self._update(game, url, fetch)
+
+        data, age = cached
+        if age < self._ttl:
+            return data
+        if self._background:
+            self.refresh(game, url, fetch)
+            return data
+        try:
+            return self._update(game, url, fetch)
+        except Exception as e:
+            self._lasterror = e
+            return data
+
+    def wait(self, timeout = None):
+        with self._lock:
+            threads = list(self._refreshing.values())
+        for t in threads:
+            t.join(timeout)
@@ -0,0 +1,180 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Command line interface, run as "python -m pyddo". Everything it prints
+# is one JSON object per line. Only argparse and json are imported up
+# front, the login and launcher stacks (ssl, http.client, xml.etree,
+# subprocess) are imported by the subcommands that need them.
+
+import argparse
+import json
+import sys
+import os
+
+DATACENTER_URL = 'http://gls.ddo.com/GLS.DataCenterServer/Service.asmx'
+
+class CommandError(RuntimeError):
+    pass
+
+def emit(event, **fields):
+    record = {'event': event}
+    record.update(fields)
+    sys.stdout.write(json.dumps(record))
+    sys.stdout.write('\n')
+    sys.stdout.flush()
+
+def _datacenters(args):
+    from pyddo.login import query_datacenters
+    cache = None
+    if args.cache:
+        from pyddo.cache import DataCenterCache
+        # The process ends right after, a background refresh would be lost.
+        cache = DataCenterCache(ttl = args.cache_ttl, background = False)
+    return query_datacenters(args.game, args.datacenter_url, cache = cache)
+
+def _world(args, name):
+    for dc in _datacenters(args):
+        world = dc.world(name)
+        if world is not None:
+            return world
+    raise CommandError('Unknown world: {0}'.format(name))
+
+def _password(account):
+    # Passwords come from the manifest, the environment or the terminal.
+    if account.get('password') is not None:
+        return account['password']
+    env = account.get('password_env')
+    if env:
+        return os.environ[env]
+    from getpass import getpass
+    return getpass('Password for {0}: '.format(account['username']), stream = sys.stderr)
+
+def cmd_datacenters(args):
+    for dc in _datacenters(args):
+        emit('datacenter', name = dc.game_name, auth_server = dc.auth_server,
+             patch_server = dc.patch_server, worlds = [w.name for w in dc.worlds])
+
+def cmd_worlds(args):
+    for dc in _datacenters(args):
+        for w in dc.worlds:
+            emit('world', name = w.name, datacenter = dc.game_name, language = w.language,
+                 status_url = w.query_status_url)
+
+def cmd_status(args):
+    from pyddo.login import probe_worlds
+    worlds = [w for dc in _datacenters(args) for w in dc.worlds
+              if not args.worlds or w.name in args.worlds]
+    probe_worlds(worlds, args.workers, args.timeout)
+    for w in worlds:
+        fields = {'world': w.name, 'up': not w.is_down}
+        if not w.is_down:
+            fields['login_servers'] = w.login_servers
+            fields['queues'] = w.queues
+        emit('status', **fields)
+
+def _queue_progress(account):
+    def progress(response):
+        emit('queue', account = account, position = response.queue_position,
+             eta = response.eta)
+    return progress
+
+def cmd_login(args):
+    world = _world(args, args.world)
+    password = _password({'username': args.user, 'password_env': args.password_env})
+    response = world.login(args.user, password)
+    emit('login', account = args.user, world = world.name,
+         subscription = response.subscription.name, expires = response.expires)
+    if args.wait:
+        response.wait_queue(_queue_progress(args.user))
+        emit('ready', account = args.user, world = world.name)
+
+def cmd_launch(args):
+    with open(args.manifest, 'r') as f:
+        manifest = json.load(f)
+    from pyddo.launcher import MultiGameLauncher
+
+    world = _world(args, manifest['world'])
+    launcher = MultiGameLauncher()
+    launcher.game_directory = manifest['game_directory']
+    if manifest.get('verify'):
+        report = launcher.verify_install()
+        emit('verify', ok = report.ok, files = report.checked, modified = report.modified,
+             missing = report.missing, hashed = report.hashed, seconds = report.elapsed)
+        if not report.ok:
+            raise CommandError('Game directory failed verification.')
+    if manifest.get('prewarm'):
+        # true, or the options of MultiGameLauncher.prewarm().
+        options = manifest['prewarm'] if isinstance(manifest['prewarm'], dict) else {}
+        report = launcher.prewarm(**options)
+        emit('prewarm', files = len(report.files), bytes = report.bytes,
+             seconds = report.elapsed, throughput = report.throughput)
+    for account in manifest['accounts']:
+        name = account['username']
+        response = world.login(name, _password(account))
+        emit('login', account = name, world = world.name)
+        response.wait_queue(_queue_progress(name))
+        client = launcher.launch(response)
+        emit('launched', account = name, pid = client._launcher.pid,
+             outport = client.context.outport)
+
+    while launcher.is_running:
+        client = launcher.wait_any()
+        if client is not None:
+            emit('exited', account = client.login_response.account_name,
+                 returncode = client._launcher.handle_.returncode)
+    emit('done')
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'pyddo', description = 'Query, log in to and launch DDO.')
+    parser.add_argument('--game', default = 'DDO')
+    parser.add_argument('--datacenter-url', default = DATACENTER_URL)
+    parser.add_argument('--cache', action = 'store_true', help = 'use the on-disk datacenter cache')
+    parser.add_argument('--cache-ttl', type = float, default = 24 * 60 * 60)
+    sub = parser.add_subparsers(dest = 'command', required = True)
+
+    p = sub.add_parser('datacenters', help = 'list datacenters')
+    p.set_defaults(func = cmd_datacenters)
+
+    p = sub.add_parser('worlds', help = 'list worlds')
+    p.set_defaults(func = cmd_worlds)
+
+    p = sub.add_parser('status', help = 'show world status')
+    p.add_argument('worlds', nargs = '*')
+    p.add_argument('--timeout', type = float, default = 5)
+    p.add_argument('--workers', type = int, default = 8)
+    p.set_defaults(func = cmd_status)
+
+    p = sub.add_parser('login', help = 'log in an account')
+    p.add_argument('world')
+    p.add_argument('--user', required = True)
+    p.add_argument('--password-env', help = 'read the password from this environment variable')
+    p.add_argument('--wait', action = 'store_true', help = 'also wait through the login queue')
+    p.set_defaults(func = cmd_login)
+
+    p = sub.add_parser('launch', help = 'launch all accounts of a manifest')
+    p.add_argument('manifest', help = 'JSON file with game_directory, world and accounts')
+    p.set_defaults(func = cmd_launch)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        emit('error', type = type(e).__name__, message = str(e))
+        return 1
+    return 0
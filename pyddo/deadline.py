@@ -0,0 +1,91 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from contextlib import contextmanager
+from time import monotonic, sleep
+
+# A TimeoutError, so code that treats socket timeouts as OSError handles
+# a spent budget the same way.
+class DeadlineExceededError(TimeoutError):
+    pass
+
+class Deadline:
+    # One time budget shared by every step of an operation, e.g. login,
+    # queue and launch. Each socket gets whatever is left as its timeout.
+    # Without a timeout the deadline never expires.
+    def __init__(self, timeout = None):
+        self._timeout = timeout
+        self._expires = None if timeout is None else monotonic() + timeout
+
+    @staticmethod
+    def coerce(deadline):
+        # Accepts a Deadline, a number of seconds or None.
+        if isinstance(deadline, Deadline):
+            return deadline
+        return Deadline(deadline)
+
+    @property
+    def remaining(self):
+        if self._expires is None:
+            return None
+        return max(0.0, self._expires - monotonic())
+
+    @property
+    def expired(self):
+        return self._expires is not None and monotonic() >= self._expires
+
+    def _exceeded(self, what):
+        return DeadlineExceededError('{0} did not finish within {1:g} seconds.'.format(
+            what, self._timeout))
+
+    def check(self, what = 'Operation'):
+        if self.expired:
+            raise self._exceeded(what)
+
+    def timeout(self, cap = None, what = 'Operation'):
+        # Timeout for the next blocking call: the rest of the budget, at
+        # most cap. None if neither limits it.
+        self.check(what)
+        remaining = self.remaining
+        if remaining is None:
+            return cap
+        if cap is None:
+            return remaining
+        return min(cap, remaining)
+
+    def reserve(self, seconds, what = 'Operation'):
+        # Waiting past the deadline is pointless, give up right away.
+        remaining = self.remaining
+        if remaining is not None and seconds >= remaining:
+            raise self._exceeded(what)
+
+    def sleep(self, seconds, what = 'Operation'):
+        self.reserve(seconds, what)
+        sleep(seconds)
+
+    @contextmanager
+    def guard(self, what = 'Operation'):
+        # Socket timeouts that ran into the deadline become a
+        # DeadlineExceededError.
+        try:
+            yield self
+        except DeadlineExceededError:
+            raise
+        except TimeoutError:
+            if self.expired:
+                raise self._exceeded(what)
+            raise
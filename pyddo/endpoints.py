@@ -0,0 +1,131 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from threading import Lock
+from time import monotonic, perf_counter, sleep
+import socket
+
+from pyddo.deadline import DeadlineExceededError
+
+class _Endpoint:
+    __slots__ = ('address', 'index', 'latency', 'failures', 'retryat')
+
+    def __init__(self, address, index):
+        self.address = address
+        self.index = index
+        self.latency = None
+        self.failures = 0
+        self.retryat = 0.0
+
+class EndpointSet:
+    # Alternative servers for the same thing, e.g. the login servers or
+    # queue URLs of a world. Tracks a smoothed latency and the errors per
+    # endpoint; failing endpoints are skipped for an exponentially growing
+    # backoff. Without any measurements the server's own order is kept.
+    def __init__(self, addresses, smoothing = 0.3, backoff = 1.0, maxbackoff = 60.0):
+        self._endpoints = [_Endpoint(a, i) for i, a in enumerate(addresses)]
+        self._byaddress = {e.address: e for e in self._endpoints}
+        self._smoothing = smoothing
+        self._backoff = backoff
+        self._maxbackoff = maxbackoff
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._endpoints)
+
+    def __iter__(self):
+        return iter(self.addresses)
+
+    def __getitem__(self, i):
+        return self._endpoints[i].address
+
+    @property
+    def addresses(self):
+        return [e.address for e in self._endpoints]
+
+    def _rank(self, now):
+        def key(e):
+            healthy = e.retryat <= now
+            latency = e.latency if e.latency is not None else float('inf')
+            return (not healthy, e.retryat if not healthy else 0.0, latency, e.index)
+        return sorted(self._endpoints, key = key)
+
+    def ordered(self):
+        # All endpoints, best first: healthy ones by latency, then the
+        # ones in backoff by when they may be tried again.
+        with self._lock:
+            return [e.address for e in self._rank(monotonic())]
+
+    def best(self):
+        return self.ordered()[0]
+
+    def success(self, address, latency):
+        with self._lock:
+            e = self._byaddress[address]
+            e.failures = 0
+            e.retryat = 0.0
+            if e.latency is None:
+                e.latency = latency
+            else:
+                e.latency += self._smoothing * (latency - e.latency)
+
+    def failure(self, address):
+        with self._lock:
+            e = self._byaddress[address]
+            e.failures += 1
+            delay = min(self._maxbackoff, self._backoff * 2 ** (e.failures - 1))
+            e.retryat = monotonic() + delay
+
+    def latency(self, address):
+        with self._lock:
+            return self._byaddress[address].latency
+
+    def healthy(self, address):
+        with self._lock:
+            return self._byaddress[address].retryat <= monotonic()
+
+    def call(self, func, rounds = 1, delay = 0.5, sleep = sleep):
+        # Calls func(address) on the best endpoint and fails over to the
+        # next one on errors. Returns (address, result) of the endpoint
+        # that answered. When all of them failed, tries again up to rounds
+        # times in all, waiting delay seconds and twice as long after each
+        # further round, then raises the last error.
+        error = None
+        for attempt in range(rounds):
+            if attempt > 0:
+                sleep(delay * 2 ** (attempt - 1))
+            for address in self.ordered():
+                start = perf_counter()
+                try:
+                    result = func(address)
+                except DeadlineExceededError:
+                    # Out of time, not the endpoint's fault.
+                    raise
+                except (RuntimeError, OSError) as e:
+                    self.failure(address)
+                    error = e
+                    continue
+                self.success(address, perf_counter() - start)
+                return address, result
+        raise error
+
+def probe_tcp(address, timeout = 2.0):
+    # Time a TCP connect to "host:port".
+    host, _, port = address.rpartition(':')
+    start = perf_counter()
+    with socket.create_connection((host, int(port)), timeout):
+        return perf_counter() - start
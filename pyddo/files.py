@@ -0,0 +1,43 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+# Small file helpers shared by everything pyddo keeps on disk.
+
+from os.path import basename, dirname, expanduser, join
+from os import chmod, environ, makedirs, replace, unlink
+from tempfile import mkstemp
+
+def cache_directory():
+    base = environ.get('XDG_CACHE_HOME') or environ.get('LOCALAPPDATA') or expanduser('~/.cache')
+    return join(base, 'pyddo')
+
+def atomic_write(path, data, mode = None):
+    # Replaces path with data (bytes) in one step, so a reader sees either
+    # the old or the new contents, never a half written file.
+    directory = dirname(path) or '.'
+    makedirs(directory, exist_ok = True)
+    fd, tmp = mkstemp(dir = directory, prefix = '.{0}-'.format(basename(path)))
+    try:
+        with open(fd, 'wb') as f:
+            if mode is not None:
+                chmod(tmp, mode)
+            f.write(data)
+        replace(tmp, path)
+    except:
+        unlink(tmp)
+        raise
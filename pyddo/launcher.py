@@ -17,11 +17,19 @@
 #
 
 from os.path import isfile, normpath
-from os import sep, chdir
+from os import sep
 from pipes import quote
-from subprocess import Popen
+from subprocess import Popen, PIPE
 import signal
 
+from pyddo.login import GLS_TICKET_LIFETIME
+from pyddo.deadline import Deadline
+from pyddo.ports import PortAllocator, PortError
+from pyddo.supervisor import Supervisor
+from pyddo.prewarm import prewarm
+from pyddo.verify import InstallVerifier
+from pyddo.state import AdoptedProcess, LauncherState, client_entry
+
 class LauncherError(RuntimeError):
     pass
 
@@ -49,9 +57,11 @@ class LaunchContext:
         self._gamedir = value
         self._client = client
 
-    def build(self, loginresponse):
+    def build(self, loginresponse, loginserver = None, deadline = None):
+        if loginserver is None:
+            loginserver = loginresponse.world._login_endpoints(deadline).best()
         self.p = []
-        self.append('-h', loginresponse.world.login_server)
+        self.append('-h', loginserver)
         self.append('-a', loginresponse.subscription.name)
         self.append('--glsticketdirect', loginresponse.gls_ticket)
         self.append('--chatserver', loginresponse.world.chat_server)
@@ -60,7 +70,7 @@ class LaunchContext:
         self.append('--supporturl', 'https://tss.turbine.com/TSSTrowser/trowser.aspx')
         self.append('--supportserviceurl', 'https://tss.turbine.com/TSSTrowser/SubmitTicket.asmx')
         self.append('--authserverurl', 'https://gls.ddo.com/GLS.AuthServer/Service.asmx')
-        self.append('--glsticketlifetime', '21600')
+        self.append('--glsticketlifetime', str(GLS_TICKET_LIFETIME))
         self.append('--outport', self._outport)
         self.append('--language', self._language)
 
@@ -92,13 +102,50 @@ class LaunchContext:
 class NativeDDOLauncher:
     def __init__(self):
         self.handle_ = None
+        # A pyddo.scheduling.SchedulingPolicy applied to every spawn.
+        self.scheduling = None
+        self._placement = None
+        # A pyddo.logcapture.LogCapture for the client's output, which
+        # goes to the log named logname.
+        self.capture = None
+        self.logname = None
 
     def launch(self, launchcontext):
-        chdir(launchcontext.game_directory)
-        p = launchcontext.params
-        p.insert(0, launchcontext.client)
+        p = [launchcontext.client] + launchcontext.params
         # Spawn
-        self.handle_ = Popen(p)
+        if self.capture is None:
+            self.handle_ = Popen(p, cwd = launchcontext.game_directory)
+        else:
+            # Python ignores SIGPIPE and the client inherits that, so once
+            # nobody reads its pipes any more it gets EPIPE instead of dying.
+            self.handle_ = Popen(p, cwd = launchcontext.game_directory,
+                                 stdout = PIPE, stderr = PIPE, restore_signals = False)
+            self.capture.capture(self.logname or 'client', self.handle_)
+        # A relaunch gives up the old client's place.
+        self.unplace()
+        if self.scheduling is not None:
+            try:
+                self._placement = self.scheduling.place(self.handle_.pid)
+            except:
+                self.handle_.kill()
+                self.handle_.wait()
+                self.handle_ = None
+                raise
+
+    def unplace(self):
+        if self._placement is not None:
+            self.scheduling.release(self._placement)
+            self._placement = None
+
+    @property
+    def placement(self):
+        return self._placement
+
+    @property
+    def pid(self):
+        if self.handle_ is None:
+            return None
+        return self.handle_.pid
 
     @property
     def is_running(self):
@@ -115,7 +162,9 @@ class NativeDDOLauncher:
         if not self.is_running:
             raise LauncherError('DDO is not running')
         self.handle_.kill()
+        self.handle_.wait()
         self.handle_ = None
+        self.unplace()
     
 
 class GameLauncher:
@@ -126,6 +175,15 @@ class GameLauncher:
         # all platforms, but (especially with Windows) you never know.
         self._launcher = NativeDDOLauncher()
         self._context = LaunchContext()
+        self._loginresponse = None
+        self._loginserver = None
+        # A pyddo.tickets.TicketCache to take fresh tickets from on relaunch.
+        self.tickets = None
+        # The MultiGameLauncher this client belongs to, if any.
+        self._pool = None
+        # Account and world of an adopted client, which has no login response.
+        self._account = None
+        self._world = None
         
     @property
     def context(self):
@@ -139,69 +197,344 @@ class GameLauncher:
     def game_directory(self, value):
         self._context.game_directory = value
 
+    @property
+    def scheduling(self):
+        return self._launcher.scheduling
+
+    @scheduling.setter
+    def scheduling(self, policy):
+        self._launcher.scheduling = policy
+
+    @property
+    def log_capture(self):
+        return self._launcher.capture
+
+    @log_capture.setter
+    def log_capture(self, capture):
+        self._launcher.capture = capture
+
     @property
     def is_running(self):
         return self._launcher.is_running
 
+    @property
+    def pid(self):
+        return self._launcher.pid
+
+    def verify_install(self, manifest = None, workers = 4):
+        # Checks the game directory against its manifest, which is built
+        # on the first call. Only files changed since are hashed.
+        verifier = InstallVerifier(self.game_directory, manifest, workers)
+        if not isfile(verifier.manifest_path):
+            return verifier.build()
+        return verifier.verify()
+
     def wait(self):
         return self._launcher.wait()
 
     def kill(self):
         return self._launcher.kill()
     
-    def launch(self, loginresponse):
+    def launch(self, loginresponse, loginserver = None, deadline = None):
         if not loginresponse.valid:
             raise LauncherError('Invalid login response passed.')
-        self._context.build(loginresponse)
+        deadline = Deadline.coerce(deadline)
+        self._context.build(loginresponse, loginserver, deadline)
+        deadline.check('Launch')
+        self._launcher.logname = loginresponse.account_name
         self._launcher.launch(self._context)
+        self._loginresponse = loginresponse
+        self._loginserver = loginserver
+
+    def _fresh_response(self):
+        # The ticket to launch again with: a cached one for the account if
+        # there is a TicketCache, else the last one while it is valid.
+        r = self._loginresponse
+        if r is None:
+            return None
+        if self.tickets is not None and r.username is not None:
+            cached = self.tickets.get(r.world, r.username)
+            if cached is not None:
+                return cached
+        if r.expired():
+            return None
+        return r
+
+    def _restart_context(self):
+        # The launch context with the freshest ticket, None if there is no
+        # valid one left.
+        r = self._fresh_response()
+        if r is None:
+            return None
+        if r.gls_ticket != self._loginresponse.gls_ticket:
+            self._context.build(r, self._loginserver)
+            self._loginresponse = r
+        return self._context
+
+    def relaunch(self):
+        # Start the client again, e.g. after a crash, without a new login.
+        if self.is_running:
+            raise LauncherError('DDO is still running.')
+        if self._pool is not None:
+            return self._pool._relaunch(self)
+        context = self._restart_context()
+        if context is None:
+            raise LauncherError('No valid GLS ticket to relaunch with.')
+        self._launcher.launch(context)
+
+    @property
+    def login_response(self):
+        return self._loginresponse
+
+    @property
+    def account_name(self):
+        if self._loginresponse is not None:
+            return self._loginresponse.account_name
+        return self._account
+
+    @property
+    def world_name(self):
+        if self._loginresponse is not None:
+            return self._loginresponse.world.name
+        return self._world
+
+    def _adopt(self, entry):
+        # Take over a client another launcher process started.
+        self._launcher.handle_ = AdoptedProcess(entry['pid'], entry['start'])
+        self._context.outport = str(entry['outport'])
+        self._account = entry.get('account')
+        self._world = entry.get('world')
         
 class MultiGameLauncher(GameLauncher):
-    def __init__(self):
-        self._outports = []
-        self._baseoutport = 5200
-        self._nextoutport = 5200
+    def __init__(self, ports = None, restartpolicy = None, scheduling = None, prewarm = None,
+                 telemetry = None, logcapture = None, statefile = None, tickets = None):
+        # Outports are leased machine-wide, so several launcher processes
+        # can run side by side without handing out the same port.
+        self._ports = ports or PortAllocator(5200)
         self._launchers = []
+        self._supervisor = Supervisor()
+        self.restart_policy = restartpolicy
+        # Pool-wide SchedulingPolicy, a launch can bring its own.
+        self._scheduling = scheduling
+        # Options for prewarm() before the first launch, True for the
+        # defaults, None to launch from a cold cache.
+        self.prewarm_options = {} if prewarm is True else prewarm
+        self._prewarmed = None
+        # A pyddo.telemetry.Telemetry that samples every client.
+        self._telemetry = telemetry
+        # A pyddo.logcapture.LogCapture for the output of all clients.
+        self._logcapture = logcapture
+        # Running clients are recorded in statefile for adopt().
+        self._state = LauncherState(statefile) if statefile else None
+        self._supervisor.add_restart_callback(self._restarted)
+        # A pyddo.tickets.TicketCache, so restarts use a valid ticket.
+        self.tickets = tickets
         # used to verify game directory
         self._context = LaunchContext()
 
+    @property
+    def ports(self):
+        return self._ports
+
+    @property
+    def supervisor(self):
+        return self._supervisor
+
+    @property
+    def telemetry(self):
+        return self._telemetry
+
+    @property
+    def log_capture(self):
+        return self._logcapture
+
+    @property
+    def scheduling(self):
+        return self._scheduling
+
+    @scheduling.setter
+    def scheduling(self, policy):
+        self._scheduling = policy
+
+    def prewarm(self, budget = None, workers = 4, method = 'read'):
+        # Reads the client's data files into the page cache, so the clients
+        # do not all start out reading them from disk.
+        self._prewarmed = prewarm(self.context.game_directory, budget, workers, method)
+        return self._prewarmed
+
+    @property
+    def prewarm_report(self):
+        return self._prewarmed
+
+    # The pool runs many clients, the API of a single one is on launchers.
+    def _single(self):
+        raise LauncherError('A MultiGameLauncher has no single client, use its launchers.')
+
+    def relaunch(self):
+        self._single()
+
+    @property
+    def pid(self):
+        self._single()
+
+    @property
+    def login_response(self):
+        self._single()
+
+    @property
+    def account_name(self):
+        self._single()
+
+    @property
+    def world_name(self):
+        self._single()
+
+    def _lease(self, launcher):
+        # The outport is leased to the client, not to us, so it stays taken
+        # when this process exits and the client runs on until adopt().
+        self._ports.assign(int(launcher.context.outport), launcher.pid)
+
+    def _restarted(self, native):
+        for l in self._launchers:
+            if l._launcher is native:
+                self._lease(l)
+        self._save_state()
+
+    def _save_state(self):
+        if self._state is None:
+            return
+        entries = [client_entry(l) for l in self._launchers]
+        self._state.save([e for e in entries if e is not None])
+
+    def adopt(self):
+        # Takes over the clients of the state file that still run, e.g.
+        # after this process was restarted: their outports are reserved
+        # again and they are supervised, without a relaunch. They cannot
+        # be restarted automatically, since their login is gone.
+        if self._state is None:
+            return []
+        adopted = []
+        for entry in self._state.survivors():
+            if any(l.pid == entry['pid'] for l in self._launchers):
+                continue
+            try:
+                self._ports.reserve(entry['outport'], entry['pid'])
+            except PortError:
+                # Someone else's client.
+                continue
+            launcher = GameLauncher()
+            if self.context.game_directory:
+                launcher.game_directory = self.context.game_directory
+            launcher._adopt(entry)
+            self._launchers.append(launcher)
+            self._supervisor.supervise(launcher._launcher)
+            if self._telemetry is not None:
+                self._telemetry.watch(launcher)
+            adopted.append(launcher)
+        self._save_state()
+        return adopted
+
     def _getnextoutport(self):
-        port = self._nextoutport
-        # Port is now used, append to list of used ports
-        self._outports.append(port)
-        self._outports.sort()
-
-        neuport = self._baseoutport
-        while self._outports.count(neuport) > 0:
-            neuport = neuport + 1
-        self._nextoutport = neuport
-        # Return stringified version of the next outport in queue
-        return str(port)
-
-    def launch(self, loginresponse):
+        # Return stringified version of the next free outport
+        return str(self._ports.allocate())
+
+    def launch(self, loginresponse, loginserver = None, deadline = None, scheduling = None):
+        if self.prewarm_options is not None and self._prewarmed is None:
+            self.prewarm(**self.prewarm_options)
         launcher = GameLauncher()
         # Set game directory
         launcher.game_directory = self.context.game_directory
+        launcher.scheduling = scheduling or self._scheduling
+        launcher.log_capture = self._logcapture
+        launcher.tickets = self.tickets
+        launcher._pool = self
         launcher.context.outport = self._getnextoutport()
-        launcher.launch(loginresponse)
+        try:
+            launcher.launch(loginresponse, loginserver, deadline)
+        except:
+            self._ports.release(int(launcher.context.outport))
+            raise
+        self._lease(launcher)
         self._launchers.append(launcher)
+        self._supervisor.supervise(launcher._launcher, launcher.context, self.restart_policy,
+                                   prepare = launcher._restart_context)
+        if self._telemetry is not None:
+            self._telemetry.watch(launcher)
+        self._save_state()
+        return launcher
 
-    def wait(self):
+    def _relaunch(self, launcher):
+        # GameLauncher.relaunch() of one of ours: its outport, supervision,
+        # telemetry and state entry are brought back along with the client.
+        context = launcher._restart_context()
+        if context is None:
+            raise LauncherError('No valid GLS ticket to relaunch with.')
+        port = int(context.outport)
+        known = launcher in self._launchers
+        if not known:
+            # update() has given its outport back already.
+            self._ports.reserve(port)
+        try:
+            launcher._launcher.launch(context)
+        except:
+            if not known:
+                self._ports.release(port)
+            raise
+        self._lease(launcher)
+        if not known:
+            self._launchers.append(launcher)
+            if self._telemetry is not None:
+                self._telemetry.watch(launcher)
+        self._supervisor.supervise(launcher._launcher, context, self.restart_policy,
+                                   prepare = launcher._restart_context)
+        self._save_state()
+
+    def wait(self, timeout = None):
+        done = self._supervisor.wait_all(timeout)
+        self.update()
+        return done
+
+    def wait_any(self, timeout = None):
+        native = self._supervisor.wait_any(timeout)
+        exited = None
         for l in self._launchers:
-            l.wait()
+            if l._launcher is native:
+                exited = l
+        self.update()
+        return exited
 
     def kill(self):
         for l in self._launchers:
-            l.kill()
-        update()
+            if l.is_running:
+                l.kill()
+        self.update()
+
+    @property
+    def is_running(self):
+        return any(l.is_running for l in self._launchers)
 
     @property
     def running(self):
-        return any(l.running for l in self._launchers)
+        return self.is_running
+
+    @property
+    def launchers(self):
+        return list(self._launchers)
 
     def update(self):
+        # Clients waiting for a restart are still supervised.
+        supervised = self._supervisor.supervised
+        alive = []
         for l in self._launchers:
-            if not l.is_running:
+            if l.is_running or any(l._launcher is n for n in supervised):
+                alive.append(l)
+            else:
                 # A launcher has terminated, remove it
-                port = int(launcher.context.outport)
-                self._outports.remove(port)
-                self._launchers.remove(l)
+                self._ports.release(int(l.context.outport))
+                l._launcher.unplace()
+                if self._telemetry is not None:
+                    self._telemetry.unwatch(l)
+        changed = len(alive) != len(self._launchers)
+        self._launchers = alive
+        if changed:
+            self._save_state()
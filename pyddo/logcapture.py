@@ -0,0 +1,261 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Captures stdout and stderr of launched clients into one log file per
+# account, rotated by size. All pipes are read by a single selector
+# thread that never waits on a client, so a chatty one is read as fast as
+# it writes without slowing down anything else. Windows cannot select on
+# pipes, there every pipe gets a reader thread.
+#
+# The pipes end with the launcher: once it exits or closes the capture,
+# clients get EPIPE on further output (SIGPIPE stays ignored for them), and
+# a launcher that adopts them later cannot capture their output again.
+
+from os.path import join
+from os import makedirs, replace
+from threading import Lock, Thread
+from time import monotonic
+import selectors
+import socket
+import os
+import re
+import sys
+
+def log_name(name):
+    # Account names straight from the GLS, made safe as file names.
+    return re.sub(r'[^\w.-]', '_', name) or 'client'
+
+class _Log:
+    # A size-rotated file. Writes go through a buffer of at most
+    # buffersize bytes, flushed when full or once it is older than
+    # flushinterval seconds.
+    def __init__(self, path, maxbytes, backups, buffersize, flushinterval):
+        self.path = path
+        self.maxbytes = maxbytes
+        self.backups = backups
+        self.buffersize = buffersize
+        self.flushinterval = flushinterval
+        self.streams = 0
+        self.written = 0
+        self.dropped = 0
+        self._pending = []
+        self._pendingsize = 0
+        self._pendingsince = None
+        self._file = None
+        self._size = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'ab', buffering = 0)
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                src = '{0}.{1}'.format(self.path, i)
+                if os.path.exists(src):
+                    replace(src, '{0}.{1}'.format(self.path, i + 1))
+            replace(self.path, self.path + '.1')
+        else:
+            os.truncate(self.path, 0)
+        self._open()
+
+    def write(self, data):
+        if not self._pending:
+            self._pendingsince = monotonic()
+        self._pending.append(data)
+        self._pendingsize += len(data)
+        if self._pendingsize >= self.buffersize:
+            self.flush()
+
+    def due(self, now):
+        # Seconds until the buffer has to be flushed, None if it is empty.
+        if not self._pending:
+            return None
+        return max(0.0, self._pendingsince + self.flushinterval - now)
+
+    def flush(self):
+        if not self._pending:
+            return
+        data = b''.join(self._pending)
+        self._pending = []
+        self._pendingsize = 0
+        self._pendingsince = None
+        try:
+            while data:
+                room = self.maxbytes - self._size
+                if room <= 0:
+                    self._rotate()
+                    continue
+                n = self._file.write(data[:room])
+                self._size += n
+                self.written += n
+                data = data[n:]
+        except OSError:
+            # A full or broken disk costs log lines, never the client.
+            self.dropped += len(data)
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+class LogCapture:
+    # Hand capture() a Popen started with stdout and stderr as PIPE.
+    def __init__(self, directory, maxbytes = 10 * 1024 * 1024, backups = 3,
+                 buffersize = 64 * 1024, flushinterval = 0.25):
+        self._directory = directory
+        self._maxbytes = maxbytes
+        self._backups = backups
+        self._buffersize = buffersize
+        self._flushinterval = flushinterval
+        self._lock = Lock()
+        self._logs = {}
+        self._selector = None
+        self._wakeup = None
+        self._thread = None
+        self._closed = False
+        self._threaded = sys.platform == 'win32'
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def path(self, name):
+        return join(self._directory, log_name(name) + '.log')
+
+    def _log(self, name):
+        # One open log per account, shared by its streams and relaunches.
+        path = self.path(name)
+        log = self._logs.get(path)
+        if log is None:
+            makedirs(self._directory, exist_ok = True)
+            log = _Log(path, self._maxbytes, self._backups, self._buffersize,
+                       self._flushinterval)
+            self._logs[path] = log
+        return log
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        self._selector = selectors.DefaultSelector()
+        self._wakeup = socket.socketpair()
+        self._wakeup[0].setblocking(False)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ, None)
+        self._thread = Thread(target = self._run, name = 'pyddo-logcapture', daemon = True)
+        self._thread.start()
+
+    def capture(self, name, popen):
+        streams = [s for s in (popen.stdout, popen.stderr) if s is not None]
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Log capture has been closed.')
+            log = self._log(name)
+            log.streams += len(streams)
+        for stream in streams:
+            if self._threaded:
+                Thread(target = self._drain, args = (stream, log), daemon = True).start()
+                continue
+            os.set_blocking(stream.fileno(), False)
+            with self._lock:
+                self._start()
+                self._selector.register(stream, selectors.EVENT_READ, log)
+            self._wakeup[1].send(b'\0')
+
+    def _finished(self, stream, log):
+        stream.close()
+        log.streams -= 1
+        if log.streams == 0:
+            log.close()
+            self._logs.pop(log.path, None)
+
+    def _drain(self, stream, log):
+        fd = stream.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            with self._lock:
+                if not data:
+                    self._finished(stream, log)
+                    return
+                log.write(data)
+                log.flush()
+
+    def _flush_due(self):
+        # Flushes the logs whose buffer is old enough, returns the time
+        # until the next one is.
+        now = monotonic()
+        timeout = None
+        for log in self._logs.values():
+            due = log.due(now)
+            if due is not None and due <= 0:
+                log.flush()
+            elif due is not None and (timeout is None or due < timeout):
+                timeout = due
+        return timeout
+
+    def _run(self):
+        timeout = None
+        while True:
+            events = self._selector.select(timeout)
+            with self._lock:
+                for key, mask in events:
+                    if key.data is None:
+                        try:
+                            self._wakeup[0].recv(64)
+                        except BlockingIOError:
+                            pass
+                        continue
+                    try:
+                        data = os.read(key.fd, 65536)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        data = b''
+                    if data:
+                        key.data.write(data)
+                        continue
+                    self._selector.unregister(key.fileobj)
+                    self._finished(key.fileobj, key.data)
+                # However busy other clients are, no log lags behind by
+                # more than its flush interval.
+                timeout = self._flush_due()
+                if self._closed:
+                    return
+
+    def flush(self):
+        with self._lock:
+            for log in self._logs.values():
+                log.flush()
+
+    def close(self):
+        # Stops reading; clients still running lose their pipes.
+        with self._lock:
+            self._closed = True
+        if self._thread is not None:
+            self._wakeup[1].send(b'\0')
+            self._thread.join()
+            for key in list(self._selector.get_map().values()):
+                if key.data is not None:
+                    key.fileobj.close()
+            self._selector.close()
+            for s in self._wakeup:
+                s.close()
+            self._thread = None
+        with self._lock:
+            for log in self._logs.values():
+                log.close()
+            self._logs = {}
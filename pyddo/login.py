@@ -16,13 +16,27 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from http.client import HTTPConnection, HTTPSConnection
-from urllib.parse import urlparse, quote_plus
-from re import sub
-from time import sleep
+from functools import partial
+from http.client import HTTPException
+from io import BytesIO
+from time import monotonic, time
 import xml.etree.ElementTree as ElementTree
-import socket
-import ssl
+
+from pyddo.session import default_session
+from pyddo.queue import QueueCoordinator, QueueEstimator
+from pyddo.endpoints import EndpointSet, probe_tcp
+from pyddo.deadline import Deadline
+from pyddo import soap
+
+# Seconds a GLS ticket stays valid, as requested from the client.
+GLS_TICKET_LIFETIME = 21600
+
+# Rounds over all queue urls before taking a number fails, and the
+# seconds to wait before the second round (doubled for every further one).
+QUEUE_ROUNDS = 3
+QUEUE_RETRY_DELAY = 0.5
+# Seconds a probed world status is trusted.
+STATUS_TTL = 60
 
 class LoginError(RuntimeError):
     pass
@@ -30,39 +44,64 @@ class LoginError(RuntimeError):
 class InvalidCredentialsError(LoginError):
     pass
     
-# From: http://bugs.python.org/issue11220
-class _HTTPSConnectionV3(HTTPSConnection):
-    def __init__(self, *args, **kwargs):
-        HTTPSConnection.__init__(self, *args, **kwargs)
-
-    def connect(self):
-        sock = socket.create_connection((self.host, self.port), self.timeout)
-        if self._tunnel_host:
-            self.sock = sock
-            self._tunnel()
-        try:
-            self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file, ssl_version=ssl.PROTOCOL_SSLv3)
-        except ssl.SSLError as e:
-            self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file, ssl_version=ssl.PROTOCOL_SSLv23)
-
-    
 # Helper methods
-def _stripnamespaces(rdata):
-    rdata = sub(r'\sxmlns[^\=]*\=\"[^\"]+\"', '', rdata)
-    rdata = sub(r'soap:', '', rdata)
-    return rdata
-    
+def _localname(tag):
+    # '{http://www.turbine.com/SE/GLS}Ticket' -> 'Ticket'
+    return tag.rpartition('}')[2]
+
 def _getxmlresponse(response):
-    rdata = response.read().decode('utf-8')
-    rdata = _stripnamespaces(rdata)
-    xml = ElementTree.fromstring(rdata)
-    return xml
+    # Parse straight from the response stream. Namespaces are resolved by
+    # the parser, afterwards only the local names are kept on the tags.
+    parser = ElementTree.iterparse(response, events = ('start',))
+    for event, elem in parser:
+        elem.tag = _localname(elem.tag)
+    return parser.root
+
+def _iterxml(source, parent):
+    # Yields every child of a parent element as soon as it is complete, and
+    # drops it from the tree afterwards so only one is kept in memory.
+    stack = []
+    for event, elem in ElementTree.iterparse(source, events = ('start', 'end')):
+        if event == 'start':
+            elem.tag = _localname(elem.tag)
+            stack.append(elem)
+            continue
+        stack.pop()
+        if stack and stack[-1].tag == parent:
+            yield elem
+            stack[-1].remove(elem)
+
+def _find_text(xml, path):
+    elem = xml.find(path)
+    if elem is None:
+        raise LoginError('Reply is missing {0}.'.format(path))
+    return elem.text
+
+def _split_list(text):
+    return [s for s in (text or '').split(';') if s]
+
+def _keep_endpoints(current, addresses):
+    # Keep what was learned about the endpoints unless the list changed.
+    if current is not None and current.addresses == addresses:
+        return current
+    return EndpointSet(addresses)
+
+async def _run_blocking(func, *args, **kwargs):
+    # The blocking calls share the session's connection pool, so running
+    # them on the loop's executor lets many of them be in flight at once.
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
     
 class Subscription:
-    def __init__(self, response, world, datacenter):
-        self._response = response
-        self._world = world
-        self._datacenter = datacenter
+    __slots__ = ('_name', '_status', '_gamename', '_description', '_tokens')
+
+    def __init__(self):
+        self._name = None
+        self._status = None
+        self._gamename = None
+        self._description = None
+        self._tokens = []
         
     @property
     def name(self):
@@ -86,18 +125,32 @@ class Subscription:
         
     def _parse_xml(self, xml):
         self._gamename = xml.find('Game').text
-        if self._gamename is None or self._gamename is '':
+        if not self._gamename:
             raise LoginError('Invalid subscription data: No game name')
         self._name = xml.find('Name').text
-        if self._name is None or self._name is '':
+        if not self._name:
             raise LoginError('Invalid subscription data: No subscription name')
         self._description = xml.find('Description').text
         self._status = xml.find('Status').text
         tokens = xml.find('ProductTokens')
         self._tokens = []
         if tokens is not None:
-            for t in tokens.getchildren():
+            for t in tokens:
                 self._tokens.append(t.text)
+
+    def _to_dict(self):
+        return {'game': self._gamename, 'name': self._name, 'description': self._description,
+                'status': self._status, 'tokens': list(self._tokens)}
+
+    @staticmethod
+    def _from_dict(d):
+        sub = Subscription()
+        sub._gamename = d['game']
+        sub._name = d['name']
+        sub._description = d.get('description')
+        sub._status = d.get('status')
+        sub._tokens = list(d.get('tokens', []))
+        return sub
     
 class LoginResponse:
     def __init__(self, world, datacenter):
@@ -106,90 +159,192 @@ class LoginResponse:
         self._ticket = 0
         self._nowserving = 0
         self._context = None
+        self._queueurl = None
+        # TakeANumber bodies per queue url, they only change with the ticket.
+        self._takeanumber = {}
         self._glsticket = None
+        self._loginwith = None
+        self._subscriptions = []
+        self._bygame = {}
+        self._issued = None
+        # The name the account logged in with, None if not known.
+        self._username = None
+        self._estimator = QueueEstimator()
         
     def _parse_xml(self, xml):
+        self._issued = time()
         sub = xml.find('Body/LoginAccountResponse/LoginAccountResult')
         # Get the most important thing: The GLS Ticket
         self._glsticket = sub.find('Ticket').text
         # Get all subscriptions
-        subs = sub.findall('Subscriptions/GameSubscription')
-        self._subscriptions = []
-        for s in subs:
-            sub = Subscription(self, self._world, self._datacenter)
+        subs = []
+        for s in sub.findall('Subscriptions/GameSubscription'):
+            sub = Subscription()
             sub._parse_xml(s)
-            self._subscriptions.append(sub)
-        self._loginwith = None
+            subs.append(sub)
+        self._set_subscriptions(subs)
+
+    def _set_subscriptions(self, subs):
+        self._subscriptions = subs
+        self._bygame = {}
+        for sub in subs:
+            self._bygame[sub.game_name] = sub
         # Check for valid subscription
-        for s in self._subscriptions:
-            if s.game_name == self._datacenter.game_name:
-                self._loginwith = s
+        self._loginwith = self._bygame.get(self._datacenter.game_name)
         if self._loginwith is None:
             raise LoginError('No subscription for the specified game found.')
+
+    @staticmethod
+    def _from_ticket(world, ticket, subscriptions, issued, username = None):
+        # Rebuild a response from a ticket that was handed out earlier.
+        response = LoginResponse(world, world.datacenter)
+        response._glsticket = ticket
+        response._issued = issued
+        response._username = username
+        response._set_subscriptions(subscriptions)
+        return response
             
-    def _talk_to_queue(self, params):
+    def _talk_to_queue(self, body, deadline = None):
         if self._loginwith is None:
             raise LoginError('No subscription to login with.')
     
-        u = urlparse('https://gls.ddo.com/GLS.AuthServer/LoginQueue.aspx')              
-        c = _HTTPSConnectionV3(u.netloc, u.port)
-        c.putrequest("POST", u.path)
-        c.putheader("Content-Length", len(params))
-        c.endheaders()
-        c.send(bytes(params, "utf-8"))
-
-        r = c.getresponse()
-        if r.getcode() is not 200:
-            raise LoginError('Failed to talk to the queue.')
-            
-        xml = _getxmlresponse(r)
+        deadline = Deadline.coerce(deadline)
+        session = self._datacenter.session
+        with deadline.guard('Queue'), \
+             session.request('POST', self._datacenter.queue_server, body, soap.FORM_HEADERS,
+                             timeout = deadline.timeout(what = 'Queue'), endpoint = 'queue') as r:
+            if r.getcode() != 200:
+                raise LoginError('Failed to talk to the queue.')
+            xml = _getxmlresponse(r)
         return xml
  
-    def leave_queue(self):
+    def leave_queue(self, deadline = None):
         if self._context is None:
             raise LoginError('Cannot leave a queue since we did not join one.')
-        params = "command=LeaveQueue&subscription={0}&context={1}&ticket_type=GLS&queue_url={2}"
-        params = params.format(self._loginwith.name, 
-            quote_plus(self._context), 
-            quote_plus(self._world.queue))
-            
-        xml = self._talk_to_queue(params)
-            
-    def query_queue(self):
-        params = "command=TakeANumber&subscription={0}&ticket={1}&ticket_type=GLS&queue_url={2}"
-        params = params.format(self._loginwith.name, 
-            quote_plus(self._glsticket), 
-            quote_plus(self._world.queue))
-       
-        xml = self._talk_to_queue(params)
+        body = soap.encode_form(('command', 'LeaveQueue'),
+                                ('subscription', self._loginwith.name),
+                                ('context', self._context),
+                                ('ticket_type', 'GLS'),
+                                ('queue_url', self._queueurl))
+        xml = self._talk_to_queue(body, deadline)
+
+    def _take_a_number(self, queueurl, deadline = None):
+        body = self._takeanumber.get(queueurl)
+        if body is None:
+            body = soap.encode_form(('command', 'TakeANumber'),
+                                    ('subscription', self._loginwith.name),
+                                    ('ticket', self._glsticket),
+                                    ('ticket_type', 'GLS'),
+                                    ('queue_url', queueurl))
+            self._takeanumber[queueurl] = body
+        xml = self._talk_to_queue(body, deadline)
 
         ticketerror = int(xml.find('HResult').text, 0)
         if ticketerror > 0:
             raise LoginError('Queue reported an error.')
+        return xml
+            
+    def query_queue(self, deadline = None):
+        # Once in a queue, stay with it. Before that, take the fastest
+        # healthy queue and fail over to the others.
+        deadline = Deadline.coerce(deadline)
+        if self._queueurl is not None:
+            xml = self._take_a_number(self._queueurl, deadline)
+        else:
+            queues = self._world._queue_endpoints(deadline)
+            self._queueurl, xml = queues.call(partial(self._take_a_number, deadline = deadline),
+                                              QUEUE_ROUNDS, QUEUE_RETRY_DELAY,
+                                              partial(deadline.sleep, what = 'Queue'))
             
         self._ticket = int(xml.find('QueueNumber').text, 0)
         self._nowserving = int(xml.find('NowServingNumber').text, 0)
         self._context = xml.find('ContextNumber').text
+        self._estimator.update(self._ticket, self._nowserving)
+
+    def _observe_nowserving(self, nowserving):
+        # Now serving number seen by another account in the same queue.
+        if nowserving > self._nowserving:
+            self._nowserving = nowserving
+            self._estimator.update(self._ticket, nowserving)
+
+    def _configure_wait(self, mininterval, maxinterval):
+        if mininterval is not None:
+            self._estimator.mininterval = mininterval
+        if maxinterval is not None:
+            self._estimator.maxinterval = maxinterval
     
-    def wait_queue(self):
+    def wait_queue(self, callback = None, mininterval = None, maxinterval = None,
+                   deadline = None):
+        # With a deadline, gives up with a DeadlineExceededError once the
+        # next poll would be too late. The place in the queue is kept.
+        self._configure_wait(mininterval, maxinterval)
+        deadline = Deadline.coerce(deadline)
         done = 0
         while not done:
-            self.query_queue()
+            self.query_queue(deadline)
             if not self.wait_required:
                 done = 1
             else:
+                if callback is not None:
+                    callback(self)
                 # Sleep before querying again.
-                sleep(1)
+                deadline.sleep(self._estimator.next_interval(), 'Queue')
+
+    async def leave_queue_async(self, deadline = None):
+        await _run_blocking(self.leave_queue, deadline)
+
+    async def query_queue_async(self, deadline = None):
+        await _run_blocking(self.query_queue, deadline)
+
+    async def wait_queue_async(self, callback = None, mininterval = None, maxinterval = None,
+                               deadline = None):
+        import asyncio
+        self._configure_wait(mininterval, maxinterval)
+        deadline = Deadline.coerce(deadline)
+        while True:
+            await self.query_queue_async(deadline)
+            if not self.wait_required:
+                break
+            if callback is not None:
+                callback(self)
+            interval = self._estimator.next_interval()
+            deadline.reserve(interval, 'Queue')
+            await asyncio.sleep(interval)
     
     @property
     def valid(self):
         return not (self._glsticket is None)
 
+    @property
+    def issued(self):
+        return self._issued
+
+    @property
+    def expires(self):
+        if self._issued is None:
+            return None
+        return self._issued + GLS_TICKET_LIFETIME
+
+    def expired(self, margin = 0):
+        return self._issued is None or time() + margin >= self.expires
+
     @property
     def wait_required(self):
         if self._ticket == 0 or self._nowserving == 0:
             raise LoginError('Join a queue first, before asking if you have to wait.')
         return (self._ticket >= self._nowserving)
+
+    @property
+    def queue_position(self):
+        return self._estimator.remaining
+
+    @property
+    def queue_rate(self):
+        return self._estimator.rate
+
+    @property
+    def eta(self):
+        return self._estimator.eta
     
     @property
     def gls_ticket(self):
@@ -198,11 +353,22 @@ class LoginResponse:
     @property
     def account_name(self):
         return self._loginwith.name
+
+    @property
+    def username(self):
+        return self._username
         
     @property
     def subscription(self):
         return self._loginwith
 
+    @property
+    def subscriptions(self):
+        return self._subscriptions
+
+    def subscription_for(self, game):
+        return self._bygame.get(game)
+
     @property
     def world(self):
         return self._world
@@ -212,8 +378,17 @@ class LoginResponse:
         return self._datacenter
     
 class World:
+    __slots__ = ('_datacenter', '_name', '_loginurl', '_chatserver', '_language',
+                 '_statusurl', '_loginservers', '_worldqueues', '_down', '_checked',
+                 '_coordinator')
+
     def __init__(self, datacenter):
         self._datacenter = datacenter
+        self._loginservers = None
+        self._worldqueues = None
+        self._down = None
+        self._checked = None
+        self._coordinator = None
         
     def __eq__(self, other):
         if type(other) is World:
@@ -221,110 +396,156 @@ class World:
         elif type(other) is str:
             return self.name == other
         return False
+
+    def __hash__(self):
+        return hash(self.name)
         
-    def login(self, username, password):
-        if username is '' or password is '':
+    def login(self, username, password, deadline = None):
+        if not username or not password:
             raise LoginError('Invalid credentials provided.')
-            
-        xml = """<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <LoginAccount xmlns="http://www.turbine.com/SE/GLS">
-      <username>%s</username>
-      <password>%s</password>
-      <additionalInfo></additionalInfo>
-    </LoginAccount>
-  </soap:Body>
-</soap:Envelope>
-""" % (username, password)
-            
-        u = urlparse(self._datacenter.auth_server)
-        c = _HTTPSConnectionV3(u.netloc, u.port)
-        c.putrequest('POST', u.path)
-        c.putheader('Content-type: text/xml; charset=utf-8')
-        c.putheader('SOAPAction', 'http://www.turbine.com/SE/GLS/LoginAccount')
-        c.putheader('Content-Length', str(len(xml)))
-        c.endheaders()
-        c.send(bytes(xml, "utf-8"))
-        
-        r = c.getresponse()
-        code = r.getcode()
-        if code is not 200:
-            if code == 500:
-                raise InvalidCredentialsError('Invalid username or password used for login.')
-            raise LoginError('Failed to login the specified account.')
-            
-        xml = _getxmlresponse(r)
+
+        body = soap.LOGIN_ACCOUNT.encode(username = username, password = password)
+        deadline = Deadline.coerce(deadline)
+        session = self._datacenter.session
+        with deadline.guard('Login'), \
+             session.request('POST', self._datacenter.auth_server, body, soap.LOGIN_ACCOUNT_HEADERS,
+                             deadline.timeout(what = 'Login'), endpoint = 'login') as r:
+            code = r.getcode()
+            if code != 200:
+                if code == 500:
+                    raise InvalidCredentialsError('Invalid username or password used for login.')
+                raise LoginError('Failed to login the specified account.')
+            xml = _getxmlresponse(r)
+
         response = LoginResponse(self, self._datacenter)
         response._parse_xml(xml)
+        response._username = username
         
         return response
 
+    async def login_async(self, username, password, deadline = None):
+        return await _run_blocking(self.login, username, password, deadline)
+
+    def queue_coordinator(self):
+        # Shared by all accounts queueing for this world.
+        if self._coordinator is None:
+            self._coordinator = QueueCoordinator()
+        return self._coordinator
+
     def _parse_xml(self, xml):
         self._name = xml.find('Name').text
-        if self._name is '':
+        if not self._name:
             raise LoginError('Invalid world received: No name specified.')
         self._loginurl = xml.find('LoginServerUrl').text
-        if self._loginurl is '':
+        if not self._loginurl:
             raise LoginError('Invalid world received: No login url.')
         self._chatserver =  xml.find('ChatServerUrl').text
-        if self._chatserver is '':
+        if not self._chatserver:
             raise LoginError('Invalid world received: No chat server url.')
         # Language is not that important
         self._language = xml.find('Language').text
         self._statusurl = xml.find('StatusServerUrl').text
-        if self._statusurl is '':
+        if not self._statusurl:
             raise LoginError('Invalid world received: No status query url.')
-        self._loginservers = None
-        self._worldqueues = None
             
-    def _query_details(self):
+    def _query_details(self, deadline = None):
+        # deadline is a Deadline or a timeout in seconds.
+        deadline = Deadline.coerce(deadline)
         try:
-            u = urlparse(self._statusurl)
-            c = HTTPConnection(u.netloc, u.port)
-            c.putrequest("GET", u.path + '?' + u.query)
-            c.putheader("Content-Type", "text/xml; charset=utf-8")
-            c.endheaders()
-
-            r = c.getresponse()
-            if r.getcode() is not 200:                
-                raise LoginError("Failed to query information about the server.")
-        
-            xml = _getxmlresponse(r)
+            self._checked = monotonic()
+            session = self._datacenter.session
+            headers = {"Content-Type": "text/xml; charset=utf-8"}
+            with deadline.guard('Status query'), \
+                 session.request("GET", self._statusurl, headers = headers,
+                                 timeout = deadline.timeout(what = 'Status query'),
+                                 endpoint = 'status') as r:
+                if r.getcode() != 200:
+                    raise LoginError("Failed to query information about the server.")
+                xml = _getxmlresponse(r)
 
-            loginserver = xml.find("loginservers").text
-            self._loginservers = loginserver.split(';')
-            if len(self._loginservers) == 0:
+            loginservers = _split_list(_find_text(xml, "loginservers"))
+            if len(loginservers) == 0:
                 raise LoginError('World provided no login server or servers.')
+            self._loginservers = _keep_endpoints(self._loginservers, loginservers)
             
-            worldqueue = xml.find("queueurls").text
-            self._worldqueues = worldqueue.split(';')
-            if len(self._worldqueues) == 0:
+            worldqueues = _split_list(_find_text(xml, "queueurls"))
+            if len(worldqueues) == 0:
                 raise LoginError('World provided no queue or queues.')
+            self._worldqueues = _keep_endpoints(self._worldqueues, worldqueues)
             
             self._down = False
-        except xml.etree.ElementTree.ParseError as pe:
+        except ElementTree.ParseError as pe:
             # XML error means wrong or no reply: Server is down.
             self._down = True
         except: # Rethrow other exceptions
             raise
+
+    def refresh_status(self, timeout = None):
+        try:
+            self._query_details(timeout)
+        except (LoginError, OSError, HTTPException):
+            # Unreachable or broken status server: Treat the world as down.
+            self._down = True
+        return not self._down
+
+    def _status_fresh(self, ttl):
+        return self._checked is not None and monotonic() - self._checked < ttl
+
+    def _require_details(self, deadline = None):
+        # A world that was down may be back, so only a recent up is trusted.
+        if self._down is not False or not self._status_fresh(STATUS_TTL):
+            self._query_details(deadline)
+        if self._down:
+            raise LoginError('World {0} is down.'.format(self.name))
             
     @property
     def name(self):
         return self._name
         
+    def _login_endpoints(self, deadline = None):
+        if self._loginservers is None:
+            self._require_details(deadline)
+        return self._loginservers
+
+    def _queue_endpoints(self, deadline = None):
+        if self._worldqueues is None:
+            self._require_details(deadline)
+        return self._worldqueues
+
     @property
     def login_server(self):
-        if self._loginservers is None:
-            self._query_details()
-        return self._loginservers[0]
+        return self._login_endpoints().best()
     
     @property
     def queue(self):
-        if self._worldqueues is None:
-            self._query_details()
-        return self._worldqueues[0]
+        return self._queue_endpoints().best()
+
+    @property
+    def login_servers(self):
+        return self._login_endpoints().addresses
+
+    @property
+    def queues(self):
+        return self._queue_endpoints().addresses
+
+    def probe_login_servers(self, timeout = 2.0):
+        # Measure a TCP connect to every login server, so login_server
+        # picks the fastest one that answers.
+        from concurrent.futures import ThreadPoolExecutor
+        servers = self._login_endpoints()
+        def probe(address):
+            try:
+                servers.success(address, probe_tcp(address, timeout))
+            except (OSError, ValueError):
+                servers.failure(address)
+        with ThreadPoolExecutor(max_workers = len(servers)) as pool:
+            list(pool.map(probe, servers.addresses))
+        return servers.best()
         
+    @property
+    def datacenter(self):
+        return self._datacenter
+
     @property
     def login_url(self):
         return self._loginurl
@@ -343,13 +564,29 @@ class World:
         
     @property
     def is_down(self):
+        if self._down is None:
+            self.refresh_status()
         return self._down
+
+    @property
+    def status_age(self):
+        if self._checked is None:
+            return None
+        return monotonic() - self._checked
         
     def __str__(self):
         return self.name
         
     
 class DataCenter:
+    __slots__ = ('_session', '_name', '_authserver', '_patchserver', 'config',
+                 '_worlds', '_byname')
+
+    def __init__(self, session = None):
+        self._session = session
+        self._worlds = []
+        self._byname = {}
+
     def _parse_xml(self, xml):
         self._name = xml.find('Name').text
         self._authserver = xml.find('AuthServer').text
@@ -357,10 +594,12 @@ class DataCenter:
         self.config = xml.find('LauncherConfigurationServer').text
         ws = xml.findall('Worlds/*')
         self._worlds = []
+        self._byname = {}
         for w in ws:
             world = World(self)
             world._parse_xml(w)
             self._worlds.append(world)
+            self._byname[world.name] = world
             
     @property
     def game_name(self):
@@ -370,6 +609,11 @@ class DataCenter:
     def auth_server(self):
         return self._authserver
     
+    @property
+    def queue_server(self):
+        # The login queue lives next to the auth server's Service.asmx.
+        return self._authserver.rpartition('/')[0] + '/LoginQueue.aspx'
+
     @property
     def patch_server(self):
         return self._patchserver
@@ -377,41 +621,62 @@ class DataCenter:
     @property
     def worlds(self):
         return self._worlds
+
+    def world(self, name):
+        return self._byname.get(name)
+
+    @property
+    def session(self):
+        if self._session is None:
+            return default_session()
+        return self._session
+
+    def refresh_status(self, maxworkers = 8, timeout = 5, ttl = STATUS_TTL):
+        return probe_worlds(self._worlds, maxworkers, timeout, ttl)
         
     def __str__(self):
         return self.game_name
         
-def query_datacenters(game = "DDO", datacenterurl = "http://gls.ddo.com/GLS.DataCenterServer/Service.asmx"):
-    url = urlparse(datacenterurl)
-    soaprequest = """<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
-<soap:Body>
-<GetDatacenters xmlns="http://www.turbine.com/SE/GLS">
-  <game>%s</game>
-</GetDatacenters>
-</soap:Body>
-</soap:Envelope>
-""" % (game)
-
-    c = HTTPConnection(url.netloc, 80)
-    c.putrequest("POST", url.path)
-    c.putheader("Content-Type", "text/xml; charset=utf-8")
-    c.putheader("SOAPAction", "http://www.turbine.com/SE/GLS/GetDatacenters")
-    c.putheader("Content-Length", str(len(soaprequest)))
-    c.endheaders()
-    c.send(bytes(soaprequest, "utf-8"))
-    
-    r = c.getresponse()
-    if r.getcode() is not 200:
-        raise LoginError('Failed to query data center for information.')
-        
-    xml = _getxmlresponse(r)
-    
+def probe_worlds(worlds, maxworkers = 8, timeout = 5, ttl = STATUS_TTL):
+    # Query the status of all worlds that have not been checked within
+    # ttl seconds at once, with at most maxworkers requests in flight.
+    stale = [w for w in worlds if not w._status_fresh(ttl)]
+    if stale:
+        workers = min(maxworkers, len(stale))
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            list(pool.map(lambda w: w.refresh_status(timeout), stale))
+    return {w.name: not w.is_down for w in worlds}
+
+def _parse_datacenters(source, session):
     dcs = []
-    datacenters = xml.findall('Body/GetDatacentersResponse/GetDatacentersResult/*')
-    for dc in datacenters:
-        datacenter = DataCenter()
+    for dc in _iterxml(source, 'GetDatacentersResult'):
+        datacenter = DataCenter(session)
         datacenter._parse_xml(dc)
         dcs.append(datacenter)
-    
     return dcs
+
+def _post_datacenters(game, datacenterurl, session, handler):
+    body = soap.GET_DATACENTERS.encode(game = game)
+    with (session or default_session()).request("POST", datacenterurl,
+                                                 body, soap.GET_DATACENTERS_HEADERS,
+                                                 endpoint = 'datacenters') as r:
+        if r.getcode() != 200:
+            raise LoginError('Failed to query data center for information.')
+        return handler(r)
+
+def query_datacenters(game = "DDO", datacenterurl = "http://gls.ddo.com/GLS.DataCenterServer/Service.asmx",
+                      session = None, cache = None):
+    if cache is None:
+        return _post_datacenters(game, datacenterurl, session,
+                                 partial(_parse_datacenters, session = session))
+
+    # The cache keeps the raw reply, so it has to be read in full first.
+    fetch = partial(_post_datacenters, game, datacenterurl, session, lambda r: r.read())
+    data = cache.get(game, datacenterurl, fetch)
+    return _parse_datacenters(BytesIO(data), session)
+
+async def query_datacenters_async(game = "DDO",
+                                  datacenterurl = "http://gls.ddo.com/GLS.DataCenterServer/Service.asmx",
+                                  session = None, cache = None):
+    return await _run_blocking(query_datacenters, game, datacenterurl, session, cache)
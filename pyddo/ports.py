@@ -0,0 +1,225 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from os.path import join
+from os import getpid
+from tempfile import gettempdir
+from contextlib import contextmanager
+from heapq import heapify, heappush, heappop
+from threading import Lock
+import json
+import os
+import socket
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from pyddo.files import atomic_write
+
+class PortError(RuntimeError):
+    pass
+
+def default_lease_file():
+    return join(gettempdir(), 'pyddo-ports.json')
+
+def pid_alive(pid):
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) would terminate the process on Windows.
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == 259
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def port_free(port):
+    # The client talks UDP on its outport, but make sure nothing holds the
+    # TCP port either.
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_STREAM):
+        s = socket.socket(socket.AF_INET, kind)
+        try:
+            s.bind(('', port))
+        except OSError:
+            return False
+        finally:
+            s.close()
+    return True
+
+@contextmanager
+def _locked(path):
+    with open(path + '.lock', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class _LeaseTable:
+    # Ports leased by all pyddo processes on this machine, stored as
+    # {"port": pid} in a JSON file that is only touched under a file lock.
+    def __init__(self, path):
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    def _read(self):
+        try:
+            with open(self._path, 'r') as f:
+                leases = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Forget leases of processes that have gone away.
+        return {int(p): pid for p, pid in leases.items() if pid_alive(pid)}
+
+    def _write(self, leases):
+        data = json.dumps({str(p): pid for p, pid in leases.items()})
+        atomic_write(self._path, data.encode('utf-8'))
+
+    @contextmanager
+    def edit(self):
+        with _locked(self._path):
+            leases = self._read()
+            yield leases
+            self._write(leases)
+
+class PortAllocator:
+    def __init__(self, base = 5200, count = 1000, shared = True, leasefile = None, probe = True):
+        self._base = base
+        self._limit = base + count
+        # Ports below _next that were handed out and released again.
+        self._free = []
+        self._next = base
+        self._used = set()
+        self._lock = Lock()
+        self._probe = probe
+        self._leases = None
+        if shared:
+            self._leases = _LeaseTable(leasefile or default_lease_file())
+
+    @property
+    def used(self):
+        with self._lock:
+            return sorted(self._used)
+
+    def _candidate(self):
+        if self._free:
+            return heappop(self._free)
+        if self._next >= self._limit:
+            return None
+        port = self._next
+        self._next += 1
+        return port
+
+    def _take(self, taken):
+        skipped = []
+        try:
+            while True:
+                port = self._candidate()
+                if port is None:
+                    raise PortError('No free outport left between {0} and {1}.'
+                                    .format(self._base, self._limit - 1))
+                if port in taken or (self._probe and not port_free(port)):
+                    skipped.append(port)
+                    continue
+                self._used.add(port)
+                return port
+        finally:
+            # Ports in use by someone else might be free next time.
+            for p in skipped:
+                heappush(self._free, p)
+
+    def allocate(self):
+        with self._lock:
+            if self._leases is None:
+                return self._take(())
+            with self._leases.edit() as leases:
+                port = self._take(leases)
+                leases[port] = getpid()
+                return port
+
+    def reserve(self, port, pid = None):
+        # Take a specific port, e.g. one that a running client already uses.
+        with self._lock:
+            if port in self._used:
+                raise PortError('Port {0} is already in use.'.format(port))
+            if self._leases is not None:
+                with self._leases.edit() as leases:
+                    owner = leases.get(port)
+                    if owner is not None and owner not in (getpid(), pid):
+                        raise PortError('Port {0} is leased by process {1}.'.format(port, owner))
+                    leases[port] = pid or getpid()
+            self._used.add(port)
+            if self._base <= port < self._limit:
+                while self._next <= port:
+                    heappush(self._free, self._next)
+                    self._next += 1
+                if port in self._free:
+                    self._free.remove(port)
+                    heapify(self._free)
+
+    def assign(self, port, pid):
+        # Hands the lease of an allocated port to the process that uses it,
+        # so the port stays taken for as long as that one runs.
+        with self._lock:
+            if port not in self._used:
+                raise PortError('Port {0} was not allocated.'.format(port))
+            if self._leases is not None:
+                with self._leases.edit() as leases:
+                    leases[port] = pid
+
+    def release(self, port):
+        with self._lock:
+            if port not in self._used:
+                raise PortError('Port {0} was not allocated.'.format(port))
+            self._used.remove(port)
+            if self._base <= port < self._limit:
+                heappush(self._free, port)
+            if self._leases is not None:
+                with self._leases.edit() as leases:
+                    leases.pop(port, None)
+
+    def release_all(self):
+        with self._lock:
+            ports = list(self._used)
+        for p in ports:
+            self.release(p)
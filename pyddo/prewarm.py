@@ -0,0 +1,144 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Loads the client's data files into the OS page cache before clients
+# are launched, so they do not all hit the disk at once. Files are split
+# into chunks that are read by a pool of threads; reads release the GIL.
+
+from concurrent.futures import ThreadPoolExecutor
+from os.path import getsize, isfile, join
+from glob import glob
+from time import perf_counter
+import mmap
+import os
+
+# In the order they are warmed: the client itself, then its data.
+DATA_FILES = ('dndclient*.exe', '*.dll', 'client_*.dat')
+
+CHUNK = 8 * 1024 * 1024
+
+class PrewarmReport:
+    __slots__ = ('files', 'bytes', 'elapsed', 'errors')
+
+    def __init__(self):
+        self.files = []
+        self.bytes = 0
+        self.elapsed = 0.0
+        # (path, error) of files that could not be read.
+        self.errors = []
+
+    @property
+    def throughput(self):
+        # Bytes per second.
+        if not self.elapsed:
+            return 0.0
+        return self.bytes / self.elapsed
+
+    def __repr__(self):
+        return '<PrewarmReport {0} files, {1:.1f} MiB in {2:.2f}s, {3:.1f} MiB/s>'.format(
+            len(self.files), self.bytes / 1048576.0, self.elapsed, self.throughput / 1048576.0)
+
+def find_data_files(directory, patterns = DATA_FILES):
+    files = []
+    seen = set()
+    for pattern in patterns:
+        for path in sorted(glob(join(directory, pattern))):
+            if path not in seen and isfile(path):
+                seen.add(path)
+                files.append(path)
+    return files
+
+def _read(path, offset, length, chunk):
+    buf = bytearray(min(chunk, length))
+    view = memoryview(buf)
+    done = 0
+    with open(path, 'rb', buffering = 0) as f:
+        f.seek(offset)
+        while done < length:
+            n = f.readinto(view[:min(len(buf), length - done)])
+            if not n:
+                break
+            done += n
+    return done
+
+def _fadvise(path, offset, length, chunk):
+    # Only asks the kernel to read ahead, returns before the data is in.
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+    return length
+
+def _touch(path, offset, length, chunk):
+    # Faults every page in through a mapping of the range.
+    page = mmap.ALLOCATIONGRANULARITY
+    start = offset - offset % page
+    with open(path, 'rb') as f, \
+         mmap.mmap(f.fileno(), length + offset - start, access = mmap.ACCESS_READ,
+                   offset = start) as m:
+        total = 0
+        for i in range(offset - start, len(m), mmap.PAGESIZE):
+            total += m[i]
+    return length
+
+_METHODS = {'read': _read, 'fadvise': _fadvise, 'mmap': _touch}
+
+def prewarm(directory, budget = None, workers = 4, method = 'read', chunk = CHUNK,
+            patterns = DATA_FILES):
+    # Warms at most budget bytes of the data files in directory. method is
+    # 'read' (portable, waits for the data), 'fadvise' (POSIX only, just
+    # schedules readahead) or 'mmap' (touches every page).
+    if method == 'fadvise' and not hasattr(os, 'posix_fadvise'):
+        method = 'read'
+    warm = _METHODS[method]
+    report = PrewarmReport()
+
+    # Split the files into chunks up to the budget, in file order.
+    jobs = []
+    left = budget
+    for path in find_data_files(directory, patterns):
+        try:
+            size = getsize(path)
+        except OSError as e:
+            report.errors.append((path, e))
+            continue
+        if left is not None:
+            if left <= 0:
+                break
+            size = min(size, left)
+            left -= size
+        if size == 0:
+            continue
+        report.files.append(path)
+        for offset in range(0, size, chunk):
+            jobs.append((path, offset, min(chunk, size - offset)))
+
+    def run(job):
+        path, offset, length = job
+        try:
+            return warm(path, offset, length, chunk)
+        except (OSError, ValueError) as e:
+            report.errors.append((path, e))
+            return 0
+
+    start = perf_counter()
+    if jobs:
+        with ThreadPoolExecutor(max_workers = max(1, workers)) as pool:
+            report.bytes = sum(pool.map(run, jobs))
+    report.elapsed = perf_counter() - start
+    return report
@@ -0,0 +1,169 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from threading import Lock
+from time import monotonic, sleep
+
+class QueueEstimator:
+    # Estimates how fast a login queue moves from successive now serving
+    # numbers and derives when it is worth asking the queue again.
+    def __init__(self, mininterval = 0.5, maxinterval = 30.0, smoothing = 0.3):
+        self.mininterval = mininterval
+        self.maxinterval = maxinterval
+        self._smoothing = smoothing
+        self._rate = None
+        self._last = None
+        self._ticket = 0
+        self._nowserving = 0
+        self._interval = mininterval
+
+    def update(self, ticket, nowserving, now = None):
+        if now is None:
+            now = monotonic()
+        if self._last is not None:
+            then, served = self._last
+            elapsed = now - then
+            if elapsed > 0 and nowserving >= served:
+                rate = (nowserving - served) / elapsed
+                if self._rate is None:
+                    self._rate = rate
+                else:
+                    self._rate += self._smoothing * (rate - self._rate)
+        self._last = (now, nowserving)
+        self._ticket = ticket
+        self._nowserving = nowserving
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def remaining(self):
+        # Number of tickets that are still served before ours.
+        return max(0, self._ticket - self._nowserving + 1)
+
+    @property
+    def eta(self):
+        remaining = self.remaining
+        if remaining == 0:
+            return 0.0
+        if not self._rate:
+            return None
+        return remaining / self._rate
+
+    def next_interval(self):
+        eta = self.eta
+        if eta is None:
+            # No movement seen (yet), back off gradually.
+            interval = self._interval * 2 if self._rate is not None else self.mininterval
+        else:
+            # Poll again about halfway to our turn, so we do not overshoot
+            # by much when the rate changes.
+            interval = eta / 2
+        self._interval = min(self.maxinterval, max(self.mininterval, interval))
+        return self._interval
+
+class QueueCoordinator:
+    # Drives the login queue for many accounts on one world. Every reply
+    # carries the world-wide now serving number, so one account polls for
+    # all of them and the others only talk to the queue to take their
+    # number and once they are within nearby places of the front.
+    def __init__(self, nearby = 20, mininterval = 0.5, maxinterval = 30.0):
+        self.nearby = nearby
+        self._estimator = QueueEstimator(mininterval, maxinterval)
+        self._lock = Lock()
+        self._waiting = []
+        self._nowserving = 0
+
+    def register(self, response):
+        with self._lock:
+            if response not in self._waiting:
+                self._waiting.append(response)
+
+    def unregister(self, response):
+        with self._lock:
+            if response in self._waiting:
+                self._waiting.remove(response)
+
+    @property
+    def waiting(self):
+        with self._lock:
+            return list(self._waiting)
+
+    @property
+    def now_serving(self):
+        return self._nowserving
+
+    @property
+    def rate(self):
+        return self._estimator.rate
+
+    def _share(self, responses):
+        for r in responses:
+            self._nowserving = max(self._nowserving, r._nowserving)
+        for r in responses:
+            r._observe_nowserving(self._nowserving)
+
+    def poll(self):
+        # One round of polling, returns the responses that are through the
+        # queue. Those are unregistered.
+        waiting = self.waiting
+        if not waiting:
+            return []
+
+        # Accounts need to take a number once to get into the queue at all.
+        fresh = [r for r in waiting if r._ticket == 0]
+        for r in fresh:
+            r.query_queue()
+        self._share(waiting)
+
+        queued = sorted((r for r in waiting if r._ticket != 0), key = lambda r: r._ticket)
+        near = [r for r in queued if r._ticket - self._nowserving < self.nearby]
+        if near:
+            polled = [r for r in near if r not in fresh]
+        elif fresh:
+            polled = []
+        else:
+            # Nobody is close, the front-most account polls for everyone.
+            polled = queued[:1]
+        for r in polled:
+            r.query_queue()
+        self._share(waiting)
+
+        front = queued[0]._ticket if queued else 0
+        self._estimator.update(front, self._nowserving)
+        # Only trust the queue's own answer to an account that it is through,
+        # the others are near now and poll themselves next round.
+        ready = [r for r in fresh + polled if not r.wait_required]
+        with self._lock:
+            for r in ready:
+                self._waiting.remove(r)
+        return ready
+
+    def next_interval(self):
+        return self._estimator.next_interval()
+
+    def wait(self, callback = None):
+        # Polls until every registered account is through the queue.
+        # callback(response) is called for each as soon as it is.
+        while True:
+            for r in self.poll():
+                if callback is not None:
+                    callback(r)
+            if not self.waiting:
+                return
+            sleep(self.next_interval())
@@ -0,0 +1,304 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Where and how launched clients run: CPU affinity, nice and I/O
+# priority, and cgroup v2 limits. Linux is handled with os and /proc,
+# elsewhere psutil is used if it is installed. Settings are applied right
+# after the client is spawned, to every thread it has by then; threads it
+# starts later inherit them.
+
+from os.path import join
+from glob import glob
+from threading import Lock
+import os
+import re
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class SchedulingError(RuntimeError):
+    pass
+
+IOCLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+def _parse_cpulist(text):
+    # "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def _read_cpulist(path):
+    try:
+        with open(path, 'r') as f:
+            return _parse_cpulist(f.read())
+    except (OSError, ValueError):
+        return None
+
+def available_cpus():
+    # The CPUs this process may run on, clients can only get a subset.
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    if psutil is not None:
+        return sorted(psutil.Process().cpu_affinity())
+    return list(range(os.cpu_count() or 1))
+
+def physical_cores(cpus = None):
+    # Groups logical CPUs into physical cores, SMT siblings together.
+    if cpus is None:
+        cpus = available_cpus()
+    allowed = set(cpus)
+    cores = []
+    seen = set()
+    for cpu in cpus:
+        if cpu in seen:
+            continue
+        path = '/sys/devices/system/cpu/cpu{0}/topology/thread_siblings_list'.format(cpu)
+        siblings = _read_cpulist(path) or [cpu]
+        core = [c for c in siblings if c in allowed] or [cpu]
+        seen.update(core)
+        cores.append(core)
+    return cores
+
+def numa_nodes(cpus = None):
+    if cpus is None:
+        cpus = available_cpus()
+    allowed = set(cpus)
+    nodes = []
+    def number(path):
+        return int(re.search(r'(\d+)$', path).group(1))
+    for path in sorted(glob('/sys/devices/system/node/node[0-9]*'), key = number):
+        node = [c for c in (_read_cpulist(join(path, 'cpulist')) or []) if c in allowed]
+        if node:
+            nodes.append(node)
+    return nodes or [list(cpus)]
+
+def _tasks(pid):
+    # Linux schedules threads, not processes.
+    try:
+        return [int(t) for t in os.listdir('/proc/{0}/task'.format(pid))]
+    except OSError:
+        return [pid]
+
+def set_affinity(pid, cpus):
+    if hasattr(os, 'sched_setaffinity'):
+        for tid in _tasks(pid):
+            os.sched_setaffinity(tid, cpus)
+    elif psutil is not None:
+        psutil.Process(pid).cpu_affinity(list(cpus))
+    else:
+        raise SchedulingError('Setting the CPU affinity requires psutil on this platform.')
+
+def set_nice(pid, nice):
+    if sys.platform == 'win32':
+        if psutil is None:
+            raise SchedulingError('Setting the priority requires psutil on this platform.')
+        # Windows has priority classes instead of nice levels.
+        if nice >= 10:
+            value = psutil.IDLE_PRIORITY_CLASS
+        elif nice > 0:
+            value = psutil.BELOW_NORMAL_PRIORITY_CLASS
+        elif nice < 0:
+            value = psutil.ABOVE_NORMAL_PRIORITY_CLASS
+        else:
+            value = psutil.NORMAL_PRIORITY_CLASS
+        psutil.Process(pid).nice(value)
+        return
+    for tid in _tasks(pid):
+        os.setpriority(os.PRIO_PROCESS, tid, nice)
+
+# ioprio_set(2) numbers, there is no wrapper in os.
+_IOPRIO_SET = {'x86_64': 251, 'i686': 289, 'aarch64': 30, 'armv7l': 314}
+
+def set_ionice(pid, ioclass, level = 4):
+    if ioclass not in IOCLASSES:
+        raise SchedulingError('Unknown I/O class: {0}'.format(ioclass))
+    if psutil is not None:
+        if sys.platform == 'win32':
+            value = {'realtime': psutil.IOPRIO_HIGH,
+                     'best-effort': psutil.IOPRIO_NORMAL if level < 4 else psutil.IOPRIO_LOW,
+                     'idle': psutil.IOPRIO_VERYLOW}[ioclass]
+            psutil.Process(pid).ionice(value)
+            return
+        for tid in _tasks(pid):
+            if ioclass == 'idle':
+                psutil.Process(tid).ionice(IOCLASSES[ioclass])
+            else:
+                psutil.Process(tid).ionice(IOCLASSES[ioclass], level)
+        return
+    number = _IOPRIO_SET.get(os.uname().machine) if sys.platform.startswith('linux') else None
+    if number is None:
+        raise SchedulingError('Setting the I/O priority requires psutil on this platform.')
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno = True)
+    prio = (IOCLASSES[ioclass] << 13) | (0 if ioclass == 'idle' else level)
+    for tid in _tasks(pid):
+        # IOPRIO_WHO_PROCESS is 1.
+        if libc.syscall(number, 1, tid, prio) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+class CgroupLimits:
+    # Puts every client into its own cgroup v2 below parent, with a memory
+    # limit in bytes and a CPU limit in cores (1.5 is one and a half). The
+    # parent has to be writable, i.e. delegated to this user.
+    def __init__(self, memory_max = None, cpu_max = None, parent = '/sys/fs/cgroup/pyddo',
+                 period = 100000):
+        self.memory_max = memory_max
+        self.cpu_max = cpu_max
+        self.parent = parent
+        self.period = period
+
+    def _write(self, path, value):
+        with open(path, 'w') as f:
+            f.write(value)
+
+    def _enable_controllers(self):
+        os.makedirs(self.parent, exist_ok = True)
+        controllers = []
+        if self.memory_max is not None:
+            controllers.append('+memory')
+        if self.cpu_max is not None:
+            controllers.append('+cpu')
+        if controllers:
+            self._write(join(self.parent, 'cgroup.subtree_control'), ' '.join(controllers))
+
+    def create(self, pid):
+        if not os.path.exists('/sys/fs/cgroup/cgroup.controllers'):
+            raise SchedulingError('cgroup limits need the unified (v2) cgroup hierarchy.')
+        path = join(self.parent, 'client-{0}'.format(pid))
+        try:
+            self._enable_controllers()
+            os.makedirs(path, exist_ok = True)
+            if self.memory_max is not None:
+                self._write(join(path, 'memory.max'), str(int(self.memory_max)))
+            if self.cpu_max is not None:
+                quota = int(self.cpu_max * self.period)
+                self._write(join(path, 'cpu.max'), '{0} {1}'.format(quota, self.period))
+            self._write(join(path, 'cgroup.procs'), str(pid))
+        except OSError as e:
+            raise SchedulingError('Cannot set up cgroup {0}: {1}'.format(path, e))
+        return path
+
+    def remove(self, path):
+        # Only works once the client has exited and left the group empty.
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+class Placement:
+    __slots__ = ('pid', 'slot', 'cpus', 'cgroup')
+
+    def __init__(self, pid, slot, cpus, cgroup):
+        self.pid = pid
+        self.slot = slot
+        self.cpus = cpus
+        self.cgroup = cgroup
+
+class SchedulingPolicy:
+    # spread pins each client to one logical 'cpu', one physical 'core'
+    # (with its SMT siblings) or one 'numa' node, always picking the slot
+    # with the fewest clients so they spread evenly and in order. cpus
+    # limits the CPUs that are handed out. nice and ioclass/iolevel set the
+    # priorities, cgroup is a CgroupLimits for each client.
+    def __init__(self, spread = None, cpus = None, nice = None, ioclass = None, iolevel = 4,
+                 cgroup = None):
+        if spread not in (None, 'cpu', 'core', 'numa'):
+            raise SchedulingError('Unknown spread: {0}'.format(spread))
+        if ioclass is not None and ioclass not in IOCLASSES:
+            raise SchedulingError('Unknown I/O class: {0}'.format(ioclass))
+        self.spread = spread
+        self.nice = nice
+        self.ioclass = ioclass
+        self.iolevel = iolevel
+        self.cgroup = cgroup
+        self._cpus = cpus
+        self._slots = None
+        self._usage = None
+        self._lock = Lock()
+
+    @property
+    def slots(self):
+        # The CPU sets clients are spread across.
+        if self._slots is None:
+            cpus = self._cpus if self._cpus is not None else available_cpus()
+            if self.spread == 'cpu':
+                self._slots = [[c] for c in cpus]
+            elif self.spread == 'core':
+                self._slots = physical_cores(cpus)
+            elif self.spread == 'numa':
+                self._slots = numa_nodes(cpus)
+            elif self._cpus is not None:
+                self._slots = [list(cpus)]
+            else:
+                self._slots = []
+            self._usage = [0] * len(self._slots)
+        return self._slots
+
+    def _take_slot(self):
+        with self._lock:
+            slots = self.slots
+            if not slots:
+                return None, None
+            slot = min(range(len(slots)), key = lambda i: (self._usage[i], i))
+            self._usage[slot] += 1
+            return slot, slots[slot]
+
+    def place(self, pid):
+        # Applies the policy to a freshly spawned client.
+        slot, cpus = self._take_slot()
+        placement = Placement(pid, slot, cpus, None)
+        try:
+            if cpus is not None:
+                set_affinity(pid, cpus)
+            if self.nice is not None:
+                set_nice(pid, self.nice)
+            if self.ioclass is not None:
+                set_ionice(pid, self.ioclass, self.iolevel)
+            if self.cgroup is not None:
+                placement.cgroup = self.cgroup.create(pid)
+        except OSError as e:
+            self.release(placement)
+            raise SchedulingError('Cannot apply scheduling policy to {0}: {1}'.format(pid, e))
+        except:
+            self.release(placement)
+            raise
+        return placement
+
+    def release(self, placement):
+        # Call once the client is gone.
+        if placement.slot is not None:
+            with self._lock:
+                self._usage[placement.slot] -= 1
+            placement.slot = None
+        if placement.cgroup is not None:
+            self.cgroup.remove(placement.cgroup)
+            placement.cgroup = None
+
+    @property
+    def usage(self):
+        # Number of clients per slot.
+        with self._lock:
+            self.slots
+            return list(self._usage)
@@ -0,0 +1,276 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlparse
+from functools import partial
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+import atexit
+import socket
+import ssl
+
+from pyddo.trace import Span
+from pyddo.transport import Transport
+
+def _timed_connection(timings, address, timeout, source_address = None):
+    # socket.create_connection(), with name resolution and connecting
+    # timed separately.
+    host, port = address
+    start = perf_counter()
+    infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    resolved = perf_counter()
+    timings['dns'] = resolved - start
+    error = None
+    for family, type, proto, canonname, sockaddr in infos:
+        try:
+            sock = socket.create_connection(sockaddr[:2], timeout, source_address)
+            timings['connect'] = perf_counter() - resolved
+            return sock
+        except OSError as e:
+            error = e
+    raise error
+
+class _HTTPConnection(HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        HTTPConnection.__init__(self, *args, **kwargs)
+        self.timings = {}
+        self._create_connection = partial(_timed_connection, self.timings)
+
+class _HTTPSConnection(HTTPSConnection):
+    def __init__(self, host, port, timeout, context, tlssession = None):
+        HTTPSConnection.__init__(self, host, port, timeout = timeout, context = context)
+        self.timings = {}
+        self._create_connection = partial(_timed_connection, self.timings)
+        # Offered to the server to resume an earlier TLS session.
+        self._tlssession = tlssession
+        self._tlssock = None
+        self.tls_session = None
+
+    def connect(self):
+        HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        start = perf_counter()
+        try:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname = server_hostname,
+                                                  session = self._tlssession)
+        except:
+            self.sock.close()
+            self.sock = None
+            raise
+        self.timings['tls'] = perf_counter() - start
+        self._tlssock = self.sock
+
+    def getresponse(self):
+        r = HTTPSConnection.getresponse(self)
+        # TLS 1.3 hands out session tickets after the handshake, they have
+        # been read along with the headers. Look at the socket we wrapped,
+        # the connection drops it for responses with Connection: close.
+        if self._tlssock is not None:
+            self.tls_session = self._tlssock.session
+        return r
+
+def create_ssl_context():
+    # Negotiates the best protocol both sides support, TLS 1.2 at least.
+    context = ssl.create_default_context()
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    return context
+
+_defaultlock = Lock()
+_defaultcontext = None
+
+def default_ssl_context():
+    global _defaultcontext
+    with _defaultlock:
+        if _defaultcontext is None:
+            _defaultcontext = create_ssl_context()
+        return _defaultcontext
+
+# Errors that mean a kept-alive connection was closed by the other side
+# while it sat in the pool.
+_STALE_ERRORS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+class Session(Transport):
+    def __init__(self, maxidle = 4, timeout = None, tracer = None, sslcontext = None):
+        # Idle connections per (scheme, host, port), most recently used last.
+        self._idle = {}
+        # Last TLS session per host, to resume instead of a full handshake.
+        self._tlssessions = {}
+        self._sslcontext = sslcontext
+        self._maxidle = maxidle
+        self._timeout = timeout
+        # Called with a pyddo.trace.Span after every request.
+        self.tracer = tracer
+        self._lock = Lock()
+        self._closed = False
+
+    @staticmethod
+    def _key(url):
+        if url.scheme == 'https':
+            return ('https', url.hostname, url.port or 443)
+        return ('http', url.hostname, url.port or 80)
+
+    @property
+    def ssl_context(self):
+        if self._sslcontext is None:
+            return default_ssl_context()
+        return self._sslcontext
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        if scheme == 'https':
+            with self._lock:
+                tlssession = self._tlssessions.get(key)
+            return _HTTPSConnection(host, port, timeout, self.ssl_context, tlssession)
+        return _HTTPConnection(host, port, timeout = timeout)
+
+    def _remember_tls(self, key, conn):
+        tlssession = getattr(conn, 'tls_session', None)
+        if tlssession is not None:
+            with self._lock:
+                self._tlssessions[key] = tlssession
+
+    def _acquire(self, key, timeout):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Session has been closed.')
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return self._connect(key, timeout), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if not self._closed and len(idle) < self._maxidle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, key, method, path, body, headers, timeout):
+        conn, reused = self._acquire(key, timeout)
+        try:
+            conn.request(method, path, body, headers)
+            r = conn.getresponse()
+            self._remember_tls(key, conn)
+            return conn, r, reused
+        except _STALE_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+        except:
+            conn.close()
+            raise
+        # The pooled connection went stale, try once more with a fresh one.
+        conn = self._connect(key, timeout)
+        try:
+            conn.request(method, path, body, headers)
+            r = conn.getresponse()
+            self._remember_tls(key, conn)
+            return conn, r, False
+        except:
+            conn.close()
+            raise
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @contextmanager
+    def request(self, method, url, body = None, headers = None, timeout = None,
+                endpoint = None):
+        u = urlparse(url)
+        key = self._key(u)
+        path = u.path or '/'
+        if u.query:
+            path = path + '?' + u.query
+        if timeout is None:
+            timeout = self._timeout
+
+        tracer = self.tracer
+        if tracer is None:
+            conn, r, reused = self._send(key, method, path, body, headers or {}, timeout)
+            try:
+                yield r
+            except:
+                conn.close()
+                raise
+            self._finish(key, conn, r)
+            return
+
+        span = Span(endpoint or u.path, method, url)
+        start = perf_counter()
+        try:
+            conn, r, reused = self._send(key, method, path, body, headers or {}, timeout)
+            received = perf_counter()
+            span.status = r.status
+            span.reused = reused
+            setup = 0.0
+            if not reused:
+                span.timings.update(conn.timings)
+                setup = sum(conn.timings.values())
+            span.timings['ttfb'] = received - start - setup
+            try:
+                yield r
+            except:
+                conn.close()
+                raise
+            self._finish(key, conn, r)
+            span.timings['body'] = perf_counter() - received
+        except BaseException as e:
+            span.error = e
+            raise
+        finally:
+            span.timings['total'] = perf_counter() - start
+            tracer(span)
+
+    def _finish(self, key, conn, r):
+        # Only connections whose response was read in full can be reused.
+        if r.isclosed() and not r.will_close:
+            self._release(key, conn)
+        else:
+            conn.close()
+
+    @property
+    def idle_connections(self):
+        with self._lock:
+            return sum(len(i) for i in self._idle.values())
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = self._idle
+            self._idle = {}
+            self._tlssessions = {}
+        for conns in idle.values():
+            for c in conns:
+                c.close()
+
+_defaultsession = None
+
+def default_session():
+    global _defaultsession
+    with _defaultlock:
+        if _defaultsession is None:
+            _defaultsession = Session()
+            atexit.register(_defaultsession.close)
+        return _defaultsession
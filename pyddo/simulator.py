@@ -0,0 +1,166 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# A simulated GLS: datacenter, auth, status and login queue endpoints
+# with replies shaped like the real ones. Serve it in memory through
+# pyddo.transport.MemoryTransport, or over HTTP with tests/fakegls.py.
+
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape, unescape
+from threading import Lock
+from time import monotonic
+import re
+
+DATACENTER_PATH = '/GLS.DataCenterServer/Service.asmx'
+AUTH_PATH = '/GLS.AuthServer/Service.asmx'
+QUEUE_PATH = '/GLS.AuthServer/LoginQueue.aspx'
+STATUS_PATH = '/GLS.StatusServer/status'
+
+_ENVELOPE = ('<?xml version="1.0" encoding="utf-8"?>'
+             '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+             'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+             'xmlns:xsd="http://www.w3.org/2001/XMLSchema">'
+             '<soap:Body>{0}</soap:Body></soap:Envelope>')
+
+def world_name(i):
+    return 'World{0:04d}'.format(i)
+
+def datacenters_xml(baseurl, worlds = 8, game = 'DDO'):
+    ws = []
+    for i in range(worlds):
+        name = world_name(i)
+        ws.append('<World><Name>{0}</Name>'
+                  '<LoginServerUrl>127.0.0.1:{1}</LoginServerUrl>'
+                  '<ChatServerUrl>127.0.0.1:{2}</ChatServerUrl>'
+                  '<StatusServerUrl>{3}{4}?s={0}</StatusServerUrl>'
+                  '<Order>{5}</Order><Language>EN</Language></World>'
+                  .format(name, 9000 + i, 9500 + i, baseurl, STATUS_PATH, i))
+    body = ('<GetDatacentersResponse xmlns="http://www.turbine.com/SE/GLS">'
+            '<GetDatacentersResult><Datacenter>'
+            '<Name>{0}</Name>'
+            '<AuthServer>{1}{2}</AuthServer>'
+            '<PatchServer>127.0.0.1:6015</PatchServer>'
+            '<LauncherConfigurationServer>{1}/launcher/config.aspx</LauncherConfigurationServer>'
+            '<Worlds>{3}</Worlds>'
+            '</Datacenter></GetDatacentersResult></GetDatacentersResponse>'
+            .format(escape(game), baseurl, AUTH_PATH, ''.join(ws)))
+    return _ENVELOPE.format(body)
+
+def login_xml(ticket, account, game = 'DDO'):
+    body = ('<LoginAccountResponse xmlns="http://www.turbine.com/SE/GLS">'
+            '<LoginAccountResult>'
+            '<Ticket>{0}</Ticket>'
+            '<Subscriptions><GameSubscription>'
+            '<Game>{1}</Game><Name>{2}</Name>'
+            '<Description>{1} subscription</Description><Status>Active</Status>'
+            '<ProductTokens><string>DDO_VIP</string><string>DDO_BASE</string></ProductTokens>'
+            '</GameSubscription></Subscriptions>'
+            '</LoginAccountResult></LoginAccountResponse>'
+            .format(escape(ticket), escape(game), escape(account)))
+    return _ENVELOPE.format(body)
+
+def status_xml(world, queues = 2):
+    urls = ';'.join('https://127.0.0.1/GLS.AuthServer/{0}/q{1}'.format(world, i)
+                    for i in range(queues))
+    return ('<?xml version="1.0" encoding="utf-8"?><Status>'
+            '<name>{0}</name>'
+            '<loginservers>127.0.0.1:9000;127.0.0.1:9001</loginservers>'
+            '<queuenames>q0</queuenames>'
+            '<queueurls>{1}</queueurls>'
+            '</Status>'.format(world, urls))
+
+def queue_xml(ticket, nowserving, context):
+    return ('<?xml version="1.0" encoding="utf-8"?><Result>'
+            '<Command>TakeANumber</Command><HResult>0x00000000</HResult>'
+            '<QueueName>q0</QueueName>'
+            '<QueueNumber>{0:#010x}</QueueNumber>'
+            '<NowServingNumber>{1:#010x}</NowServingNumber>'
+            '<LoginTier>1</LoginTier><ContextNumber>{2}</ContextNumber>'
+            '</Result>'.format(ticket, nowserving, context))
+
+class SimulatedQueue:
+    # Hands out numbers per GLS ticket and serves rate numbers per second.
+    def __init__(self, rate, backlog):
+        self._lock = Lock()
+        self._rate = rate
+        self._start = monotonic()
+        self._base = 1
+        self._next = 1 + backlog
+        self._tickets = {}
+
+    def take(self, ticket):
+        with self._lock:
+            number = self._tickets.get(ticket)
+            if number is None:
+                number = self._next
+                self._next += 1
+                self._tickets[ticket] = number
+            serving = self._base + int((monotonic() - self._start) * self._rate)
+            return number, max(1, serving)
+
+class GLSSimulator:
+    # Answers requests by path. A password of 'bad' fails the login like
+    # the real auth server does, with a 500.
+    def __init__(self, baseurl = 'http://gls.simulated', worlds = 8, rate = 1000.0,
+                 backlog = 0, game = 'DDO'):
+        self.baseurl = baseurl
+        self.datacenters = datacenters_xml(baseurl, worlds, game)
+        self._datacenters = self.datacenters.encode('utf-8')
+        self.queue = SimulatedQueue(rate, backlog)
+        self._counts = {}
+        self._countlock = Lock()
+
+    @property
+    def datacenter_url(self):
+        return self.baseurl + DATACENTER_PATH
+
+    @property
+    def requests(self):
+        with self._countlock:
+            return dict(self._counts)
+
+    def _count(self, path):
+        with self._countlock:
+            self._counts[path] = self._counts.get(path, 0) + 1
+
+    def handle(self, method, url, body = None, headers = None):
+        # Returns (status, reply bytes) for a request to url, which may
+        # also be just the path and query.
+        u = urlparse(url)
+        self._count(u.path)
+        if method == 'GET':
+            if u.path != STATUS_PATH:
+                return 404, b''
+            world = parse_qs(u.query).get('s', [''])[0]
+            return 200, status_xml(world).encode('utf-8')
+
+        if u.path == DATACENTER_PATH:
+            return 200, self._datacenters
+        if u.path == AUTH_PATH:
+            text = (body or b'').decode('utf-8')
+            user = re.search('<username>(.*?)</username>', text, re.S)
+            password = re.search('<password>(.*?)</password>', text, re.S)
+            if user is None or password is None or unescape(password.group(1)) == 'bad':
+                return 500, b''
+            account = unescape(user.group(1))
+            return 200, login_xml('TICKET+' + account + '/=', account).encode('utf-8')
+        if u.path == QUEUE_PATH:
+            params = parse_qs((body or b'').decode('utf-8'))
+            ticket = params.get('ticket', [''])[0]
+            number, serving = self.queue.take(ticket)
+            return 200, queue_xml(number, serving, number).encode('utf-8')
+        return 404, b''
@@ -0,0 +1,79 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Request bodies for the GLS. Templates are split and encoded to UTF-8
+# once, filling them in only escapes and encodes the values. Bodies are
+# bytes, so http.client sends them with the headers in one buffer and
+# Content-Length is their exact size.
+
+from string import Formatter
+from urllib.parse import quote_plus
+from xml.sax.saxutils import escape
+
+class Template:
+    __slots__ = ('_parts', '_fields')
+
+    def __init__(self, text):
+        # _parts[i] comes before _fields[i], a trailing part after the last.
+        self._parts = []
+        self._fields = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            self._parts.append(literal.encode('utf-8'))
+            if field is not None:
+                self._fields.append(field)
+
+    @property
+    def fields(self):
+        return list(self._fields)
+
+    def encode(self, **values):
+        out = []
+        for part, field in zip(self._parts, self._fields):
+            out.append(part)
+            out.append(escape(str(values[field])).encode('utf-8'))
+        if len(self._parts) > len(self._fields):
+            out.append(self._parts[-1])
+        return b''.join(out)
+
+def _envelope(body):
+    return Template('<?xml version="1.0" encoding="utf-8"?>\n'
+                    '<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                    'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+                    'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">\n'
+                    '  <soap:Body>\n' + body + '  </soap:Body>\n</soap:Envelope>\n')
+
+def _headers(action):
+    return {'Content-Type': 'text/xml; charset=utf-8',
+            'SOAPAction': 'http://www.turbine.com/SE/GLS/' + action}
+
+LOGIN_ACCOUNT = _envelope('    <LoginAccount xmlns="http://www.turbine.com/SE/GLS">\n'
+                          '      <username>{username}</username>\n'
+                          '      <password>{password}</password>\n'
+                          '      <additionalInfo></additionalInfo>\n'
+                          '    </LoginAccount>\n')
+LOGIN_ACCOUNT_HEADERS = _headers('LoginAccount')
+
+GET_DATACENTERS = _envelope('    <GetDatacenters xmlns="http://www.turbine.com/SE/GLS">\n'
+                            '      <game>{game}</game>\n'
+                            '    </GetDatacenters>\n')
+GET_DATACENTERS_HEADERS = _headers('GetDatacenters')
+
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+def encode_form(*pairs):
+    # application/x-www-form-urlencoded, in the order given.
+    return '&'.join(k + '=' + quote_plus(v) for k, v in pairs).encode('ascii')
@@ -0,0 +1,146 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Which clients a launcher runs, kept on disk so a restarted launcher
+# can take them over instead of relaunching them. A client is identified
+# by pid and process start time, so a reused pid is never mistaken for it.
+
+from subprocess import TimeoutExpired
+from time import monotonic, sleep
+import json
+import os
+import select
+import signal
+
+from pyddo.files import atomic_write
+from pyddo.ports import pid_alive
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# The exit status of a process that is not our child cannot be known.
+UNKNOWN_RETURNCODE = 255
+
+def process_start_time(pid):
+    # Start time in an opaque, per-boot unit, None if there is no process
+    # or no way to tell.
+    if os.path.isdir('/proc/self'):
+        try:
+            with open('/proc/{0}/stat'.format(pid), 'r') as f:
+                fields = f.read().rpartition(')')[2].split()
+        except FileNotFoundError:
+            return None
+        except OSError:
+            fields = None
+        if fields is not None:
+            # Zombies are as good as gone.
+            if fields[0] in ('Z', 'X'):
+                return None
+            return int(fields[19])
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).create_time()
+        except psutil.Error:
+            return None
+    return None
+
+class AdoptedProcess:
+    # Stands in for the Popen of a client that another launcher process
+    # started, so the supervisor and launchers can handle it alike.
+    def __init__(self, pid, start):
+        self.pid = pid
+        self.start = start
+        self.returncode = None
+        self.stdout = None
+        self.stderr = None
+
+    def _alive(self):
+        if self.start is None:
+            return pid_alive(self.pid)
+        return process_start_time(self.pid) == self.start
+
+    def poll(self):
+        if self.returncode is None and not self._alive():
+            self.returncode = UNKNOWN_RETURNCODE
+        return self.returncode
+
+    def wait(self, timeout = None):
+        end = None if timeout is None else monotonic() + timeout
+        fd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                fd = os.pidfd_open(self.pid)
+            except OSError:
+                pass
+        try:
+            while self.poll() is None:
+                left = None if end is None else end - monotonic()
+                if left is not None and left <= 0:
+                    raise TimeoutExpired(self.pid, timeout)
+                if fd is not None:
+                    select.select([fd], [], [], left)
+                else:
+                    sleep(0.5 if left is None else min(0.5, left))
+        finally:
+            if fd is not None:
+                os.close(fd)
+        return self.returncode
+
+    def kill(self):
+        if self.poll() is None:
+            os.kill(self.pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+def client_entry(launcher):
+    # The state of one GameLauncher, or None if it runs nothing.
+    pid = launcher.pid
+    if pid is None:
+        return None
+    handle = launcher._launcher.handle_
+    start = getattr(handle, 'start', None)
+    if start is None:
+        start = process_start_time(pid)
+    return {'pid': pid, 'start': start, 'outport': int(launcher.context.outport),
+            'account': launcher.account_name, 'world': launcher.world_name}
+
+class LauncherState:
+    # A small JSON file with one entry per running client.
+    def __init__(self, path):
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self):
+        try:
+            with open(self._path, 'r') as f:
+                return json.load(f)['clients']
+        except FileNotFoundError:
+            return []
+        except (ValueError, KeyError):
+            # Without a usable state there is nothing to adopt.
+            return []
+
+    def save(self, clients):
+        atomic_write(self._path, json.dumps({'clients': clients}).encode('utf-8'))
+
+    def survivors(self):
+        # Entries whose client is still the same process.
+        return [c for c in self.load()
+                if c.get('start') is not None and process_start_time(c['pid']) == c['start']]
@@ -0,0 +1,218 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from threading import Condition, Thread, Timer
+from time import monotonic
+import selectors
+import socket
+import os
+
+class RestartPolicy:
+    # Restart a client when it exits, at most maxrestarts times within
+    # window seconds. With onfailure, a clean exit (code 0) is final.
+    def __init__(self, maxrestarts = 3, window = 300.0, onfailure = True, delay = 1.0):
+        self.maxrestarts = maxrestarts
+        self.window = window
+        self.onfailure = onfailure
+        self.delay = delay
+
+    def should_restart(self, returncode, restarts):
+        if self.onfailure and returncode == 0:
+            return False
+        now = monotonic()
+        recent = [t for t in restarts if now - t < self.window]
+        return len(recent) < self.maxrestarts
+
+class _Watch:
+    __slots__ = ('launcher', 'context', 'policy', 'callback', 'prepare', 'popen', 'restarts')
+
+    def __init__(self, launcher, context, policy, callback, prepare):
+        self.launcher = launcher
+        self.context = context
+        self.policy = policy
+        self.callback = callback
+        self.prepare = prepare
+        self.popen = launcher.handle_
+        self.restarts = []
+
+class Supervisor:
+    # Watches NativeDDOLauncher instances and learns about exiting clients
+    # from the OS: through pidfds in a single selector thread where the
+    # platform has them, otherwise from one thread blocked in wait() per
+    # client. Nothing is polled, so an idle supervisor uses no CPU.
+    def __init__(self):
+        self._cond = Condition()
+        self._watches = {}
+        self._exited = []
+        self._callbacks = []
+        self._restartcallbacks = []
+        self._selector = None
+        self._thread = None
+        self._wakeup = None
+        self._closed = False
+        self._pidfd = hasattr(os, 'pidfd_open')
+
+    def add_callback(self, callback):
+        # Called as callback(launcher, returncode) whenever a client exits.
+        self._callbacks.append(callback)
+
+    def add_restart_callback(self, callback):
+        # Called as callback(launcher) once a client has been restarted.
+        self._restartcallbacks.append(callback)
+
+    def _start_selector(self):
+        if self._thread is not None:
+            return
+        self._selector = selectors.DefaultSelector()
+        self._wakeup = socket.socketpair()
+        self._wakeup[0].setblocking(False)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ, None)
+        self._thread = Thread(target = self._run, name = 'pyddo-supervisor', daemon = True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            for key, events in self._selector.select():
+                if key.data is None:
+                    try:
+                        self._wakeup[0].recv(64)
+                    except BlockingIOError:
+                        pass
+                    if self._closed:
+                        return
+                    continue
+                self._selector.unregister(key.fileobj)
+                os.close(key.fd)
+                self._reap(key.data)
+
+    def _watch(self, watch):
+        pid = watch.popen.pid
+        if self._pidfd:
+            try:
+                fd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                # Already gone and reaped.
+                self._reap(watch)
+                return
+            except OSError:
+                self._pidfd = False
+            else:
+                self._start_selector()
+                self._selector.register(fd, selectors.EVENT_READ, watch)
+                self._wakeup[1].send(b'\0')
+                return
+        Thread(target = self._wait, args = (watch,), daemon = True).start()
+
+    def _wait(self, watch):
+        watch.popen.wait()
+        self._reap(watch)
+
+    def _reap(self, watch):
+        returncode = watch.popen.wait()
+        for callback in self._callbacks + ([watch.callback] if watch.callback else []):
+            callback(watch.launcher, returncode)
+
+        # Do not bring back a client that was killed or relaunched by hand.
+        restart = (watch.policy is not None and not self._closed
+                   and watch.launcher.handle_ is watch.popen
+                   and watch.policy.should_restart(returncode, watch.restarts))
+        if restart:
+            watch.restarts.append(monotonic())
+            t = Timer(watch.policy.delay, self._restart, (watch,))
+            t.daemon = True
+            t.start()
+            return
+        self._exit(watch)
+
+    def _current(self, watch):
+        # A client relaunched and supervised again has a newer watch.
+        with self._cond:
+            return self._watches.get(id(watch.launcher)) is watch
+
+    def _exit(self, watch):
+        with self._cond:
+            if self._watches.get(id(watch.launcher)) is not watch:
+                return
+            self._watches.pop(id(watch.launcher))
+            self._exited.append(watch.launcher)
+            self._cond.notify_all()
+
+    def _restart(self, watch):
+        if not self._current(watch):
+            return
+        try:
+            if watch.prepare is not None:
+                watch.context = watch.prepare()
+            # Without a context, e.g. once the login ran out, the exit is final.
+            if watch.context is None:
+                self._exit(watch)
+                return
+            watch.launcher.launch(watch.context)
+        except Exception:
+            self._exit(watch)
+            return
+        watch.popen = watch.launcher.handle_
+        self._watch(watch)
+        for callback in self._restartcallbacks:
+            callback(watch.launcher)
+
+    def supervise(self, launcher, context = None, policy = None, callback = None,
+                  prepare = None):
+        # launcher is a NativeDDOLauncher that has been launched already,
+        # context is needed to launch it again under a restart policy.
+        # prepare, if given, is called before every restart and returns the
+        # context to launch with, or None to let the client stay down.
+        if launcher.handle_ is None:
+            raise RuntimeError('Only launched clients can be supervised.')
+        if policy is not None and context is None and prepare is None:
+            raise RuntimeError('A restart policy needs the launch context.')
+        watch = _Watch(launcher, context, policy, callback, prepare)
+        with self._cond:
+            self._watches[id(launcher)] = watch
+        self._watch(watch)
+
+    @property
+    def supervised(self):
+        with self._cond:
+            return [w.launcher for w in self._watches.values()]
+
+    def wait_any(self, timeout = None):
+        # Returns the next launcher whose client exited for good, or None
+        # if none did within timeout.
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._exited or not self._watches, timeout):
+                return None
+            if self._exited:
+                return self._exited.pop(0)
+            return None
+
+    def wait_all(self, timeout = None):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._watches, timeout)
+
+    def close(self):
+        self._closed = True
+        if self._thread is not None:
+            self._wakeup[1].send(b'\0')
+            self._thread.join()
+            for key in list(self._selector.get_map().values()):
+                if key.data is not None:
+                    os.close(key.fd)
+            self._selector.close()
+            for s in self._wakeup:
+                s.close()
+            self._thread = None
@@ -0,0 +1,272 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Resource usage of launched clients, including everything they spawned.
+# One background thread samples all of them from /proc on Linux, or
+# through psutil elsewhere, and keeps a rolling window per client.
+
+from collections import deque
+from threading import Event, Lock, Thread
+from time import monotonic
+import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class TelemetryError(RuntimeError):
+    pass
+
+class Sample:
+    __slots__ = ('pid', 'time', 'cpu', 'rss', 'read_bytes', 'write_bytes', 'threads',
+                 'processes')
+
+    def __init__(self, pid, time):
+        self.pid = pid
+        self.time = time
+        # Seconds of CPU time, user and system.
+        self.cpu = 0.0
+        self.rss = 0
+        # None where the I/O counters are not readable.
+        self.read_bytes = None
+        self.write_bytes = None
+        self.threads = 0
+        self.processes = 0
+
+    def __repr__(self):
+        return '<Sample pid={0} cpu={1:.2f}s rss={2:.1f}MiB threads={3} processes={4}>'.format(
+            self.pid, self.cpu, self.rss / 1048576.0, self.threads, self.processes)
+
+class Aggregate:
+    __slots__ = ('pid', 'span', 'samples', 'cpu_percent', 'rss', 'rss_max', 'read_rate',
+                 'write_rate', 'threads_max')
+
+    def __init__(self, samples):
+        first, last = samples[0], samples[-1]
+        self.pid = last.pid
+        self.samples = len(samples)
+        self.span = last.time - first.time
+        # Processes that exit take their CPU time with them, hence the max.
+        if self.span > 0:
+            self.cpu_percent = max(0.0, last.cpu - first.cpu) / self.span * 100.0
+        else:
+            self.cpu_percent = None
+        self.rss = sum(s.rss for s in samples) / len(samples)
+        self.rss_max = max(s.rss for s in samples)
+        self.read_rate = self._rate(first.read_bytes, last.read_bytes)
+        self.write_rate = self._rate(first.write_bytes, last.write_bytes)
+        self.threads_max = max(s.threads for s in samples)
+
+    def _rate(self, first, last):
+        if first is None or last is None or self.span <= 0:
+            return None
+        return max(0, last - first) / self.span
+
+    def __repr__(self):
+        cpu = '-' if self.cpu_percent is None else '{0:.1f}%'.format(self.cpu_percent)
+        return '<Aggregate pid={0} cpu={1} rss={2:.1f}MiB over {3:.1f}s>'.format(
+            self.pid, cpu, self.rss / 1048576.0, self.span)
+
+_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def _children(pid):
+    children = []
+    try:
+        tasks = os.listdir('/proc/{0}/task'.format(pid))
+    except OSError:
+        return children
+    for tid in tasks:
+        try:
+            with open('/proc/{0}/task/{1}/children'.format(pid, tid), 'r') as f:
+                children.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return children
+
+def _tree(pid):
+    pids = [pid]
+    i = 0
+    while i < len(pids):
+        pids.extend(_children(pids[i]))
+        i += 1
+    return pids
+
+def _add_proc(sample, pid):
+    with open('/proc/{0}/stat'.format(pid), 'r') as f:
+        stat = f.read()
+    # The command name may contain spaces and parentheses.
+    fields = stat[stat.rindex(')') + 2:].split()
+    sample.cpu += (int(fields[11]) + int(fields[12])) / _TICKS
+    sample.threads += int(fields[17])
+    sample.rss += int(fields[21]) * _PAGE
+    sample.processes += 1
+    if sample.processes > 1 and sample.read_bytes is None:
+        return
+    try:
+        with open('/proc/{0}/io'.format(pid), 'r') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+    except OSError:
+        # Not ours to read, leave the counters out for the whole tree.
+        sample.read_bytes = sample.write_bytes = None
+        return
+    sample.read_bytes = (sample.read_bytes or 0) + int(io['read_bytes'])
+    sample.write_bytes = (sample.write_bytes or 0) + int(io['write_bytes'])
+
+def _sample_proc(pid, now):
+    sample = Sample(pid, now)
+    for p in _tree(pid):
+        try:
+            _add_proc(sample, p)
+        except (OSError, ValueError, IndexError):
+            # Exited while we looked.
+            if p == pid:
+                return None
+    return sample
+
+def _sample_psutil(pid, now):
+    sample = Sample(pid, now)
+    try:
+        root = psutil.Process(pid)
+        procs = [root] + root.children(recursive = True)
+    except psutil.Error:
+        return None
+    io = True
+    for p in procs:
+        try:
+            with p.oneshot():
+                times = p.cpu_times()
+                sample.cpu += times.user + times.system
+                sample.rss += p.memory_info().rss
+                sample.threads += p.num_threads()
+                sample.processes += 1
+                if io:
+                    counters = p.io_counters()
+                    sample.read_bytes = (sample.read_bytes or 0) + counters.read_bytes
+                    sample.write_bytes = (sample.write_bytes or 0) + counters.write_bytes
+        except (psutil.AccessDenied, AttributeError):
+            io = False
+            sample.read_bytes = sample.write_bytes = None
+        except psutil.Error:
+            if p is root:
+                return None
+    return sample
+
+def sample(pid):
+    # One sample of pid and its descendants, None if it is gone.
+    now = monotonic()
+    if os.path.isdir('/proc/self/task'):
+        return _sample_proc(pid, now)
+    if psutil is not None:
+        return _sample_psutil(pid, now)
+    raise TelemetryError('Client telemetry needs /proc or psutil.')
+
+class Telemetry:
+    # Samples every watched launcher (anything with a pid property, e.g. a
+    # GameLauncher) each interval seconds and keeps window seconds of
+    # samples. The thread starts with the first watch.
+    def __init__(self, interval = 1.0, window = 60.0):
+        self.interval = interval
+        self.window = window
+        self._lock = Lock()
+        self._watched = {}
+        self._samples = {}
+        self._stop = Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def watch(self, launcher):
+        with self._lock:
+            self._watched[id(launcher)] = launcher
+            self._samples.setdefault(id(launcher), deque())
+        self.start()
+
+    def unwatch(self, launcher):
+        with self._lock:
+            self._watched.pop(id(launcher), None)
+            self._samples.pop(id(launcher), None)
+
+    @property
+    def watched(self):
+        with self._lock:
+            return list(self._watched.values())
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target = self._run, name = 'pyddo-telemetry', daemon = True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            self.poll()
+            if self._stop.wait(self.interval):
+                return
+
+    def poll(self):
+        # One round of sampling, also usable without the thread.
+        for launcher in self.watched:
+            pid = launcher.pid
+            s = sample(pid) if pid is not None else None
+            if s is None:
+                continue
+            with self._lock:
+                samples = self._samples.get(id(launcher))
+                if samples is None:
+                    continue
+                # A relaunched client starts a new history.
+                if samples and samples[-1].pid != s.pid:
+                    samples.clear()
+                samples.append(s)
+                while samples and s.time - samples[0].time > self.window:
+                    samples.popleft()
+
+    def snapshot(self):
+        # [(launcher, latest Sample)] of every client that has one.
+        with self._lock:
+            return [(self._watched[k], s[-1]) for k, s in self._samples.items() if s]
+
+    def aggregate(self, launcher):
+        # Aggregate over the window, None before the first sample.
+        with self._lock:
+            samples = list(self._samples.get(id(launcher), ()))
+        if not samples:
+            return None
+        return Aggregate(samples)
+
+    def top(self, n = 5, key = 'cpu_percent'):
+        # The n clients using the most of something over the window,
+        # as [(launcher, Aggregate)].
+        with self._lock:
+            items = [(self._watched[k], list(s)) for k, s in self._samples.items() if s]
+        aggregates = [(l, Aggregate(s)) for l, s in items]
+        aggregates.sort(key = lambda a: getattr(a[1], key) or 0, reverse = True)
+        return aggregates[:n]
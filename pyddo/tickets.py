@@ -0,0 +1,157 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from http.client import HTTPException
+from threading import Event, Lock, Thread
+from time import time
+import json
+
+from pyddo.files import atomic_write
+from pyddo.login import LoginError, LoginResponse, Subscription
+
+class TicketCacheError(LoginError):
+    pass
+
+def _fernet(key):
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        raise TicketCacheError('Encrypting the ticket cache requires the cryptography package.')
+    return Fernet(key)
+
+class TicketCache:
+    # Keeps GLS tickets per (account, world) until shortly before they
+    # expire, so relaunching a client does not need a new login. Entries
+    # are optionally persisted to path, encrypted when a Fernet key is
+    # given. Passwords are only ever kept in memory.
+    def __init__(self, path = None, key = None, margin = 600):
+        self._path = path
+        self._fernet = _fernet(key) if key is not None else None
+        self._margin = margin
+        self._lock = Lock()
+        self._entries = {}
+        self._credentials = {}
+        self._refresher = None
+        self._stop = Event()
+        if path is not None:
+            self._load()
+
+    @staticmethod
+    def _key(username, world):
+        return '{0}@{1}'.format(username.lower(), world.name)
+
+    def _load(self):
+        try:
+            with open(self._path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        if self._fernet is not None:
+            from cryptography.fernet import InvalidToken
+            try:
+                data = self._fernet.decrypt(data)
+            except InvalidToken:
+                raise TicketCacheError('Cannot decrypt the ticket cache, wrong key?')
+        try:
+            entries = json.loads(data.decode('utf-8'))
+        except ValueError:
+            # A broken cache only costs a login.
+            return
+        now = time()
+        self._entries = {k: e for k, e in entries.items() if e['expires'] > now}
+
+    def _save(self):
+        if self._path is None:
+            return
+        data = json.dumps(self._entries).encode('utf-8')
+        if self._fernet is not None:
+            data = self._fernet.encrypt(data)
+        atomic_write(self._path, data, 0o600)
+
+    def store(self, username, response):
+        entry = {'ticket': response.gls_ticket,
+                 'issued': response.issued,
+                 'expires': response.expires,
+                 'subscriptions': [s._to_dict() for s in response.subscriptions]}
+        with self._lock:
+            self._entries[self._key(username, response.world)] = entry
+            self._save()
+
+    def get(self, world, username, margin = None):
+        # A cached response for the account, or None if there is none that
+        # stays valid for at least margin seconds.
+        if margin is None:
+            margin = self._margin
+        with self._lock:
+            entry = self._entries.get(self._key(username, world))
+        if entry is None or entry['expires'] - margin <= time():
+            return None
+        subs = [Subscription._from_dict(d) for d in entry['subscriptions']]
+        return LoginResponse._from_ticket(world, entry['ticket'], subs, entry['issued'], username)
+
+    def invalidate(self, world, username):
+        with self._lock:
+            if self._entries.pop(self._key(username, world), None) is not None:
+                self._save()
+
+    def login(self, world, username, password):
+        # Like World.login(), but reuses a cached ticket while it is valid.
+        with self._lock:
+            self._credentials[self._key(username, world)] = (world, username, password)
+        response = self.get(world, username)
+        if response is None:
+            response = world.login(username, password)
+            self.store(username, response)
+        return response
+
+    def refresh(self, margin = None):
+        # Log in again every account we have credentials for whose ticket
+        # runs out within margin seconds. Returns the accounts that failed.
+        if margin is None:
+            margin = 2 * self._margin
+        with self._lock:
+            credentials = list(self._credentials.values())
+        failed = []
+        for world, username, password in credentials:
+            if self.get(world, username, margin) is not None:
+                continue
+            try:
+                self.store(username, world.login(username, password))
+            except (LoginError, OSError, HTTPException):
+                failed.append(username)
+        return failed
+
+    def start_refresher(self, interval = 60):
+        if self._refresher is not None:
+            return
+        self._stop.clear()
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    # Whatever went wrong, the next round tries again.
+                    pass
+        self._refresher = Thread(target = run, name = 'pyddo-tickets', daemon = True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        if self._refresher is None:
+            return
+        self._stop.set()
+        self._refresher.join()
+        self._refresher = None
@@ -0,0 +1,120 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from threading import Lock
+from bisect import bisect_left
+
+# Phases of a request, in the order they happen. dns, connect and tls are
+# only present when the request had to open a new connection.
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'body', 'total')
+
+class Span:
+    __slots__ = ('endpoint', 'method', 'url', 'status', 'reused', 'error', 'timings')
+
+    def __init__(self, endpoint, method, url):
+        self.endpoint = endpoint
+        self.method = method
+        self.url = url
+        self.status = None
+        self.reused = False
+        self.error = None
+        # Seconds spent per phase.
+        self.timings = {}
+
+    def __repr__(self):
+        phases = ' '.join('{0}={1:.3f}ms'.format(p, self.timings[p] * 1000.0)
+                          for p in PHASES if p in self.timings)
+        return '<Span {0} {1} {2} status={3} {4}>'.format(self.endpoint, self.method,
+                                                          self.url, self.status, phases)
+
+class Histogram:
+    # Latency histogram with exponential buckets, bounds are in seconds.
+    BOUNDS = tuple(0.00025 * 2 ** i for i in range(18))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile, but never
+        # more than the largest value seen.
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+class TimingAggregator:
+    # A tracer that counts spans per endpoint and status, and keeps one
+    # histogram per endpoint and phase.
+    def __init__(self):
+        self._lock = Lock()
+        self._counts = {}
+        self._histograms = {}
+
+    def __call__(self, span):
+        with self._lock:
+            key = (span.endpoint, span.status if span.status is not None else 'error')
+            self._counts[key] = self._counts.get(key, 0) + 1
+            for phase, value in span.timings.items():
+                h = self._histograms.get((span.endpoint, phase))
+                if h is None:
+                    h = self._histograms[(span.endpoint, phase)] = Histogram()
+                h.add(value)
+
+    @property
+    def counts(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def histogram(self, endpoint, phase = 'total'):
+        with self._lock:
+            return self._histograms.get((endpoint, phase))
+
+    def reset(self):
+        with self._lock:
+            self._counts = {}
+            self._histograms = {}
+
+    def report(self):
+        lines = []
+        with self._lock:
+            for (endpoint, status), n in sorted(self._counts.items(), key = str):
+                lines.append('{0} [{1}]: {2}'.format(endpoint, status, n))
+            for (endpoint, phase), h in sorted(self._histograms.items(),
+                                               key = lambda i: (str(i[0][0]), PHASES.index(i[0][1]))):
+                lines.append('{0} {1:<7} n={2:<6} mean={3:8.3f}ms p50<={4:8.3f}ms p99<={5:8.3f}ms max={6:8.3f}ms'
+                             .format(endpoint, phase, h.count, h.mean * 1000.0,
+                                     h.percentile(50) * 1000.0, h.percentile(99) * 1000.0,
+                                     h.max * 1000.0))
+        return '\n'.join(lines)
@@ -0,0 +1,96 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from contextlib import contextmanager
+from io import BytesIO
+from time import perf_counter, sleep
+
+from pyddo.trace import Span
+
+class Transport:
+    # What the login stack needs to talk to the GLS. Pass one as the
+    # session of query_datacenters() or DataCenter. request() is a context
+    # manager yielding a response with getcode() and read(); it may be
+    # streamed, so it is only valid inside the with block. The socket
+    # implementation is pyddo.session.Session.
+    tracer = None
+    timeout = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, method, url, body = None, headers = None, timeout = None,
+                endpoint = None):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+class MemoryResponse(BytesIO):
+    def __init__(self, status, data, headers = None):
+        BytesIO.__init__(self, data)
+        self.status = status
+        self.headers = headers or {}
+
+    def getcode(self):
+        return self.status
+
+    def getheader(self, name, default = None):
+        return self.headers.get(name, default)
+
+class MemoryTransport(Transport):
+    # Answers requests by calling handler(method, url, body, headers),
+    # which returns (status, reply bytes), e.g. GLSSimulator.handle from
+    # pyddo.simulator. Nothing touches the network. latency is added to
+    # every request; one that takes longer than its timeout fails like a
+    # socket would.
+    def __init__(self, handler, latency = 0.0, tracer = None, timeout = None):
+        self._handler = handler
+        self.latency = latency
+        self.tracer = tracer
+        self.timeout = timeout
+
+    @contextmanager
+    def request(self, method, url, body = None, headers = None, timeout = None,
+                endpoint = None):
+        if timeout is None:
+            timeout = self.timeout
+        span = Span(endpoint or url, method, url)
+        start = perf_counter()
+        try:
+            if self.latency:
+                if timeout is not None and self.latency > timeout:
+                    sleep(timeout)
+                    raise TimeoutError('timed out')
+                sleep(self.latency)
+            status, data = self._handler(method, url, body, headers or {})
+            received = perf_counter()
+            span.status = status
+            span.timings['ttfb'] = received - start
+            with MemoryResponse(status, data) as r:
+                yield r
+            span.timings['body'] = perf_counter() - received
+        except BaseException as e:
+            span.error = e
+            raise
+        finally:
+            span.timings['total'] = perf_counter() - start
+            if self.tracer is not None:
+                self.tracer(span)
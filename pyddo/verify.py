@@ -0,0 +1,216 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Install integrity checks. A manifest records size, mtime and a content
+# hash of every game file. Verifying only re-hashes files whose size or
+# mtime changed since, so a check of an unchanged install is just a stat
+# per file. Files are hashed in fixed-size pieces through mmap, by a pool
+# of threads (hashlib releases the GIL), and a file's hash is the hash of
+# its pieces' hashes, so large .dat files are hashed in parallel too.
+
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from hashlib import sha1
+from os.path import abspath, join, relpath
+from time import perf_counter
+import hashlib
+import json
+import mmap
+import os
+
+from pyddo.files import atomic_write, cache_directory
+
+INSTALL_FILES = ('*.exe', '*.dll', '*.dat')
+
+PIECE = 64 * 1024 * 1024
+
+class InstallError(RuntimeError):
+    pass
+
+def _hash_piece(path, offset, length, algorithm):
+    h = hashlib.new(algorithm)
+    if length:
+        with open(path, 'rb') as f, \
+             mmap.mmap(f.fileno(), length, access = mmap.ACCESS_READ, offset = offset) as m:
+            h.update(m)
+    return h.digest()
+
+def _pieces(size, piece):
+    return [(offset, min(piece, size - offset)) for offset in range(0, size, piece)] or [(0, 0)]
+
+def scan(directory, patterns = INSTALL_FILES):
+    # {relative path: (size, mtime_ns)} of the install's files.
+    files = {}
+    def walk(path):
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks = False):
+                    walk(entry.path)
+                elif entry.is_file() and any(fnmatch(entry.name.lower(), p) for p in patterns):
+                    st = entry.stat()
+                    rel = relpath(entry.path, directory).replace(os.sep, '/')
+                    files[rel] = (st.st_size, st.st_mtime_ns)
+    walk(directory)
+    return files
+
+class VerifyReport:
+    __slots__ = ('checked', 'modified', 'missing', 'added', 'hashed', 'bytes', 'elapsed')
+
+    def __init__(self):
+        self.checked = 0
+        # Relative paths.
+        self.modified = []
+        self.missing = []
+        self.added = []
+        # Files and bytes that had to be hashed.
+        self.hashed = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not (self.modified or self.missing)
+
+    def __repr__(self):
+        return ('<VerifyReport {0} files, {1} modified, {2} missing, {3} added, '
+                '{4} hashed ({5:.1f} MiB) in {6:.2f}s>').format(
+                    self.checked, len(self.modified), len(self.missing), len(self.added),
+                    self.hashed, self.bytes / 1048576.0, self.elapsed)
+
+class InstallVerifier:
+    # Keeps the manifest of one game directory, by default in the user's
+    # cache directory since the install itself may not be writable.
+    def __init__(self, directory, manifest = None, workers = 4, algorithm = 'blake2b',
+                 patterns = INSTALL_FILES, piece = PIECE):
+        self._directory = abspath(directory)
+        if manifest is None:
+            key = sha1(self._directory.encode('utf-8')).hexdigest()
+            manifest = join(cache_directory(), 'install-{0}.json'.format(key[:16]))
+        self._manifestpath = manifest
+        self._workers = workers
+        self._algorithm = algorithm
+        self._patterns = patterns
+        self._piece = piece
+        self._entries = None
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def manifest_path(self):
+        return self._manifestpath
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        try:
+            with open(self._manifestpath, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise InstallError('No manifest for {0}, build one first.'.format(self._directory))
+        except ValueError:
+            raise InstallError('Broken install manifest {0}.'.format(self._manifestpath))
+        if data.get('algorithm') != self._algorithm or data.get('piece') != self._piece:
+            raise InstallError('Install manifest was built with other hash settings.')
+        self._entries = data['files']
+        return self._entries
+
+    def _save(self, entries):
+        data = json.dumps({'directory': self._directory, 'algorithm': self._algorithm,
+                           'piece': self._piece, 'files': entries}, sort_keys = True)
+        atomic_write(self._manifestpath, data.encode('utf-8'))
+        self._entries = entries
+
+    def _hash(self, names):
+        # {relative path: hex digest}, all pieces of all files in one pool.
+        jobs = []
+        for name in names:
+            path = join(self._directory, name)
+            for offset, length in _pieces(os.path.getsize(path), self._piece):
+                jobs.append((name, path, offset, length))
+        def run(job):
+            name, path, offset, length = job
+            return _hash_piece(path, offset, length, self._algorithm)
+        with ThreadPoolExecutor(max_workers = max(1, self._workers)) as pool:
+            digests = list(pool.map(run, jobs))
+        pieces = {}
+        for (name, path, offset, length), digest in zip(jobs, digests):
+            pieces.setdefault(name, []).append(digest)
+        result = {}
+        for name, ds in pieces.items():
+            h = hashlib.new(self._algorithm)
+            for d in ds:
+                h.update(d)
+            result[name] = h.hexdigest()
+        return result
+
+    def _check(self, entries, update):
+        start = perf_counter()
+        report = VerifyReport()
+        current = scan(self._directory, self._patterns)
+        report.checked = len(current)
+        report.missing = sorted(n for n in entries if n not in current)
+        changed = [n for n, (size, mtime) in current.items()
+                   if n not in entries or entries[n]['size'] != size or entries[n]['mtime'] != mtime]
+        digests = self._hash(changed)
+        report.hashed = len(changed)
+        report.bytes = sum(current[n][0] for n in changed)
+
+        new = {}
+        for name, (size, mtime) in current.items():
+            entry = entries.get(name)
+            if name in digests:
+                digest = digests[name]
+                if entry is None:
+                    report.added.append(name)
+                elif entry['hash'] != digest:
+                    report.modified.append(name)
+                    if not update:
+                        # Keep the known good hash to compare against.
+                        new[name] = entry
+                        continue
+                entry = {'size': size, 'mtime': mtime, 'hash': digest}
+            new[name] = entry
+        if not update:
+            # Added files are not part of the install until updated.
+            new = {n: e for n, e in new.items() if n in entries}
+            new.update((n, entries[n]) for n in report.missing)
+        report.added.sort()
+        report.modified.sort()
+        if update or new != entries:
+            self._save(new)
+        report.elapsed = perf_counter() - start
+        return report
+
+    def build(self):
+        # Hashes everything and takes it as the known good state.
+        return self._check({}, True)
+
+    def update(self):
+        # Takes the current state as known good, e.g. after patching.
+        # Only changed files are hashed.
+        try:
+            entries = self._load()
+        except InstallError:
+            entries = {}
+        return self._check(entries, True)
+
+    def verify(self):
+        # Compares the install with the manifest. Files that were only
+        # touched get their new mtime recorded, so they are not hashed again.
+        return self._check(self._load(), False)
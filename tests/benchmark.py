@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Measures the login stack against the local fake GLS server in
+# fakegls.py. Runs offline, e.g.:
+#
+#   python3 benchmark.py --accounts 1,10,50 --worlds 8,128,1024
+
+import sys
+sys.path.insert(0, '..')
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from time import perf_counter
+import argparse
+
+from pyddo.login import query_datacenters, _getxmlresponse
+from pyddo.session import Session
+from pyddo.simulator import GLSSimulator
+from pyddo.transport import MemoryTransport
+from fakegls import FakeGLSServer
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    k = max(0, min(len(s) - 1, int(round(p / 100.0 * len(s) + 0.5)) - 1))
+    return s[k]
+
+def report(name, samples, elapsed):
+    ms = [x * 1000.0 for x in samples]
+    print('{0:<32} n={1:<6} {2:>9.1f}/s  p50={3:8.3f}ms  p90={4:8.3f}ms  p99={5:8.3f}ms  max={6:8.3f}ms'
+          .format(name, len(ms), len(ms) / elapsed if elapsed else 0.0,
+                  percentile(ms, 50), percentile(ms, 90), percentile(ms, 99),
+                  max(ms) if ms else 0.0))
+    sys.stdout.flush()
+
+def timed(func, *args):
+    start = perf_counter()
+    func(*args)
+    return perf_counter() - start
+
+def run(func, items, concurrency):
+    start = perf_counter()
+    if concurrency <= 1:
+        samples = [timed(func, i) for i in items]
+    else:
+        with ThreadPoolExecutor(max_workers = concurrency) as pool:
+            samples = list(pool.map(lambda i: timed(func, i), items))
+    return samples, perf_counter() - start
+
+def bench_parse(worlds, iterations):
+    with FakeGLSServer(worlds) as server:
+        data = server.datacenters.encode('utf-8')
+    samples, elapsed = run(lambda i: _getxmlresponse(BytesIO(data)), range(iterations), 1)
+    report('parse datacenters ({0} worlds, {1}kB)'.format(worlds, len(data) // 1024),
+           samples, elapsed)
+
+def bench_datacenters(worlds, iterations):
+    with FakeGLSServer(worlds) as server, Session() as session:
+        url = server.datacenter_url
+        samples, elapsed = run(lambda i: query_datacenters(datacenterurl = url, session = session),
+                               range(iterations), 1)
+    report('query_datacenters ({0} worlds)'.format(worlds), samples, elapsed)
+
+def bench_login(accounts, iterations):
+    with FakeGLSServer() as server, Session(maxidle = accounts) as session:
+        world = query_datacenters(datacenterurl = server.datacenter_url, session = session)[0].worlds[0]
+        names = ['account{0}'.format(i % accounts) for i in range(iterations)]
+        samples, elapsed = run(lambda n: world.login(n, 'secret'), names, accounts)
+    report('World.login ({0} accounts)'.format(accounts), samples, elapsed)
+
+def bench_queue(accounts, iterations):
+    with FakeGLSServer() as server, Session(maxidle = accounts) as session:
+        world = query_datacenters(datacenterurl = server.datacenter_url, session = session)[0].worlds[0]
+        responses = [world.login('account{0}'.format(i), 'secret') for i in range(accounts)]
+        items = [responses[i % accounts] for i in range(iterations)]
+        samples, elapsed = run(lambda r: r.query_queue(), items, accounts)
+    report('query_queue ({0} accounts)'.format(accounts), samples, elapsed)
+
+def bench_wait_queue(accounts, rate):
+    # Every account starts behind a backlog that drains at rate per second.
+    with FakeGLSServer(rate = rate, backlog = int(rate)) as server, \
+         Session(maxidle = accounts) as session:
+        world = query_datacenters(datacenterurl = server.datacenter_url, session = session)[0].worlds[0]
+        responses = [world.login('account{0}'.format(i), 'secret') for i in range(accounts)]
+        samples, elapsed = run(lambda r: r.wait_queue(mininterval = 0.05), responses, accounts)
+        polls = server.requests.get('/GLS.AuthServer/LoginQueue.aspx', 0)
+    report('wait_queue ({0} accounts, {1} polls)'.format(accounts, polls), samples, elapsed)
+
+def bench_memory_login(accounts):
+    # The whole login stack without sockets: parsing and bookkeeping only.
+    sim = GLSSimulator()
+    transport = MemoryTransport(sim.handle)
+    world = query_datacenters(datacenterurl = sim.datacenter_url, session = transport)[0].worlds[0]
+    names = ['account{0}'.format(i) for i in range(accounts)]
+    samples, elapsed = run(lambda n: world.login(n, 'secret'), names, 1)
+    report('World.login in memory ({0} accounts)'.format(accounts), samples, elapsed)
+
+def bench_memory_coordinator(accounts, rate):
+    # Many simulated accounts sharing one queue through a QueueCoordinator.
+    sim = GLSSimulator(rate = rate, backlog = int(rate))
+    transport = MemoryTransport(sim.handle)
+    world = query_datacenters(datacenterurl = sim.datacenter_url, session = transport)[0].worlds[0]
+    coordinator = world.queue_coordinator()
+    for i in range(accounts):
+        coordinator.register(world.login('account{0}'.format(i), 'secret'))
+    samples, elapsed = run(lambda i: coordinator.wait(), range(1), 1)
+    polls = sim.requests.get('/GLS.AuthServer/LoginQueue.aspx', 0)
+    report('coordinated queue in memory ({0} accounts, {1} polls)'.format(accounts, polls),
+           samples, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark pyddo against a local fake GLS server.')
+    parser.add_argument('--iterations', type = int, default = 200)
+    parser.add_argument('--accounts', default = '1,10,50')
+    parser.add_argument('--worlds', default = '8,128,1024')
+    parser.add_argument('--queue-rate', type = float, default = 200.0)
+    parser.add_argument('--memory-accounts', default = '1000,10000')
+    args = parser.parse_args()
+
+    accounts = [int(a) for a in args.accounts.split(',')]
+    worlds = [int(w) for w in args.worlds.split(',')]
+    memory = [int(a) for a in args.memory_accounts.split(',')]
+
+    for w in worlds:
+        bench_parse(w, args.iterations)
+    for w in worlds:
+        bench_datacenters(w, args.iterations)
+    for a in accounts:
+        bench_login(a, args.iterations)
+    for a in accounts:
+        bench_queue(a, args.iterations)
+    for a in accounts:
+        bench_wait_queue(a, args.queue_rate)
+    for a in memory:
+        bench_memory_login(a)
+    for a in memory:
+        bench_memory_coordinator(a, args.queue_rate * 10)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# pyddo - Python classes to access functionality of DDO.
+# Copyright (C) 2013  Florian Stinglmayr <fstinglmayr@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# A local stand-in for the GLS datacenter, auth, status and login queue
+# endpoints. It speaks plain HTTP/1.1 with keep-alive and serves the
+# replies of pyddo.simulator.GLSSimulator.
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+
+import sys
+sys.path.insert(0, '..')
+
+from pyddo.simulator import DATACENTER_PATH, GLSSimulator
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, data):
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply(*self.server.simulator.handle('GET', self.path))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply(*self.server.simulator.handle('POST', self.path, body))
+
+class FakeGLSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, worlds = 8, rate = 1000.0, backlog = 0):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.simulator = GLSSimulator(self.url, worlds, rate, backlog)
+        self.datacenters = self.simulator.datacenters
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_port)
+
+    @property
+    def datacenter_url(self):
+        return self.url + DATACENTER_PATH
+
+    @property
+    def requests(self):
+        return self.simulator.requests
+
+    def start(self):
+        self._thread = Thread(target = self.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()